@@ -33,6 +33,7 @@ Todo
 
 from collections import namedtuple
 import itertools
+import re
 import parse
 
 ############
@@ -149,6 +150,77 @@ class NumericalParam(object):
             raise UserWarning('There are no param')
 
 
+#####################
+# answers templates
+
+_ParseResult = namedtuple("_ParseResult", ['named'])
+
+# field patterns and conversions as in parse 1.x (case insensitive). The sign position of numeric fields also
+# accepts a space, so a leading blank before a number is matched like parse does.
+_INT_PATTERN = r'[-+ ]?[-+ ]?[0-9]+|[-+ ]?0[xX][0-9a-fA-F]+|[-+ ]?0[bB][01]+|[-+ ]?0[oO][0-7]+'
+_G_PATTERN = r'[-+ ]?\d+(?:\.\d+)?(?:[eE][-+]?\d+)?|nan|[-+]?inf'
+_F_PATTERN = r'[-+ ]?(?:\d*\.\d+|nan|inf)'
+_INT_DIGITS = "0123456789abcdefghijklmnopqrstuvwxyz"
+
+
+def _int_convert(string):
+    """int of a {:d} field, same result as parse"""
+    sign, start = (-1, 1) if string[0] == '-' else (1, 1) if string[0] == '+' else (1, 0)
+    base = 10
+    if string[start] == '0' and len(string) - start > 2:
+        base = {'b': 2, 'o': 8, 'x': 16}.get(string[start + 1].lower(), 10)
+    digits = re.sub('[^{}]'.format(_INT_DIGITS[:base]), '', string.lower())
+    return sign * int(digits, base)
+
+
+# parse format type -> (regex, converter)
+_FIELD_TYPES = {None: (r'.+?', str),
+                'd': (_INT_PATTERN, _int_convert),
+                'g': (_G_PATTERN, float),
+                'f': (_F_PATTERN, float)}
+_FIELD = re.compile(r'\{(\w+)(?::([dgf]))?\}')
+
+
+class _RegexTemplate(object):
+    """Fast path for simple answers templates like ``"{level:g} dB, {status}"``.
+
+    Behave as a compiled :mod:`parse` format: :meth:`parse` return an object with a ``named`` dict or None.
+    """
+
+    def __init__(self, template):
+        self._converters = {}
+        pattern = []
+        pos = 0
+        for m in _FIELD.finditer(template):
+            name, ftype = m.groups()
+            regex, self._converters[name] = _FIELD_TYPES[ftype]
+            pattern.append(re.escape(template[pos:m.start()]))
+            pattern.append('(?P<{}>{})'.format(name, regex))
+            pos = m.end()
+        pattern.append(re.escape(template[pos:]))
+        self._regex = re.compile(''.join(pattern) + r'\Z', re.IGNORECASE | re.DOTALL)
+
+    @staticmethod
+    def is_simple(template):
+        """True if template contain only {name}, {name:d}, {name:g} or {name:f} fields."""
+        rest = _FIELD.sub('', template)
+        names = _FIELD.findall(template)
+        return '{' not in rest and '}' not in rest and len(set(names)) == len(names)
+
+    def parse(self, line):
+        m = self._regex.match(line)
+        if m is None:
+            return None
+        return _ParseResult({k: self._converters[k](v) for k, v in m.groupdict().items()})
+
+
+def compile_return(template):
+    """Compile an answers template, with a plain regex if the template is simple else with :func:`parse.compile`."""
+    if _RegexTemplate.is_simple(template):
+        return _RegexTemplate(template)
+    return parse.compile(template)
+
+
 ########### Messages ##############
 
 class Message(object):
@@ -218,10 +290,19 @@ class Message(object):
         """Return the expected number of return lines of the message."""
         return 1
 
+    @classmethod
+    def return_parser(cls):
+        """Return the compiled RETURN template. It is built on first use and cached per message class."""
+        p = cls.__dict__.get('_return_parser')
+        if p is None:
+            p = compile_return(cls.RETURN + cls.EOL)
+            cls._return_parser = p
+        return p
+
     def _parse(self, line):
         """Parse answers line according to RETURN  class attribute."""
         if self.RETURN is not None:
-            p = parse.compile(self.RETURN + self.EOL)
+            p = self.return_parser()
             try:
                 ret = p.parse(line).named
             except AttributeError as e:
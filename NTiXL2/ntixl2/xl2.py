@@ -7,6 +7,9 @@ import time
 import subprocess
 import pathlib, shutil
 import logging
+import threading
+import collections
+from concurrent.futures import Future
 import serial
 from serial.tools import list_ports
 from datetime import datetime
@@ -22,6 +25,32 @@ class XL2Error(Exception):
         return repr(self.value)
 
 
+class _PendingMessage(object):
+    """Message sent to the XL2 waiting for its answers lines."""
+    __slots__ = ['message', 'wait', 'future', 'lines', 'deadline']
+
+    def __init__(self, message, wait, future):
+        self.message = message
+        self.wait = wait
+        self.future = future
+        self.lines = []
+        self.deadline = time.monotonic() + wait
+
+    def resolve(self):
+        try:
+            self.future.set_result(self.message.parse_answers(self.lines))
+        except Exception as e:
+            self.future.set_exception(e)
+
+    def timeout(self, logger, partial=0):
+        """fail the message, partial is the number of bytes of an incomplete answer line"""
+        nbytes = sum(len(l) for l in self.lines) + partial
+        err = 'Expected {} lines on RX serial. Received {} complete lines, {} bytes'.format(
+            self.message.return_lines(), len(self.lines), nbytes)
+        logger.error('After sending {!r} message: {}.'.format(str(self.message), err))
+        self.future.set_exception(XL2Error(err))
+
+
 class XL2SLM_serial(object):
     """The XL2 device object.
 
@@ -59,6 +88,14 @@ class XL2SLM_serial(object):
         self.port = port
         self._defaut_timeout = 1.5
         self.conn = serial.Serial(baudrate=9600, timeout=self._defaut_timeout)
+        # command pipeline, see start_reader
+        self._reader = None
+        self._reader_stop = threading.Event()
+        self._pending = collections.deque()
+        self._pending_lock = threading.Lock()
+        # after an answer timeout: discard RX until the port is quiet, hold back writes meanwhile
+        self._drain_until = None
+        self._held = collections.deque()
 
     def open(self):
         if not self.conn.is_open:
@@ -76,6 +113,7 @@ class XL2SLM_serial(object):
             self.logger.info("XL2 device already open at {} port.".format(self.port))
 
     def close(self):
+        self.stop_reader()
         self.conn.close()
         self.logger.info("XL2 device at {} port closed.".format(self.port))
 
@@ -105,6 +143,165 @@ class XL2SLM_serial(object):
             self.logger.debug("No serial device with vid:{} and pid:{} found.".format(vid, pid))
             raise XL2Error("No serial device with vid:{} and pid:{} found.".format(vid, pid))
 
+    def start_reader(self, poll=0.1):
+        """Start the background reader thread.
+
+        While the reader runs, :meth:`send_message` does not block: messages are written immediately and answers
+        are matched in order to the outstanding messages. Independent queries can thus be pipelined. If an answer
+        times out all outstanding messages fail, late bytes are discarded until the port is quiet and messages sent
+        meanwhile are written afterwards.
+
+        Parameters
+        ----------
+        poll : float
+            serial read timeout of the reader thread. Bound the reaction time to :meth:`stop_reader`.
+        """
+        if self.reader_running:
+            return
+        self.flush_serial()
+        self.conn.timeout = poll
+        self._reader_stop.clear()
+        self._reader = threading.Thread(target=self._read_loop, name="XL2reader", daemon=True)
+        self._reader.start()
+        self.logger.debug("Reader thread started.")
+
+    def stop_reader(self):
+        """Stop the background reader thread. Outstanding messages fail with :class:`XL2Error`."""
+        if self._reader is None:
+            return
+        self._reader_stop.set()
+        self._reader.join()
+        self._reader = None
+        self._fail_pending(XL2Error('Reader stopped.'))
+        self.conn.timeout = self._defaut_timeout
+        self.logger.debug("Reader thread stopped.")
+
+    @property
+    def reader_running(self):
+        return self._reader is not None and self._reader.is_alive()
+
+    def _fail_pending(self, e):
+        with self._pending_lock:
+            self._drain_until = None
+            failed = list(self._pending) + [p for _, p in self._held if p is not None]
+            self._pending.clear()
+            self._held.clear()
+        for p in failed:
+            p.future.set_exception(e)
+
+    def _start_drain(self, now):
+        """Head message timed out. Return the outstanding messages, their answers can no longer be matched.
+
+        Called with the pending lock held. Late answers are discarded until no byte arrives for the default
+        timeout, see :meth:`_end_drain`.
+        """
+        failed = list(self._pending)
+        self._pending.clear()
+        self._drain_until = now + self._defaut_timeout
+        return failed
+
+    def _end_drain(self, now):
+        """Write the messages held back while draining. Called with the pending lock held."""
+        self._drain_until = None
+        while self._held:
+            data, pending = self._held.popleft()
+            if pending is not None:
+                self._pending.append(pending)
+            self.conn.write(data)
+        if self._pending:
+            self._pending[0].deadline = now + self._pending[0].wait
+
+    def _read_loop(self):
+        buf = b''
+        while not self._reader_stop.is_set():
+            try:
+                data = self.conn.readline()
+            except (serial.SerialException, OSError, TypeError) as e:
+                self.logger.error("Reader thread: serial error {}.".format(str(e)))
+                self._fail_pending(XL2Error("Serial error {}.".format(str(e))))
+                return
+            # readline returns a partial line after the poll timeout
+            buf += data
+            failed = None
+            with self._pending_lock:
+                now = time.monotonic()
+                if self._drain_until is not None:
+                    if len(data):
+                        self.logger.warning('Discarded late bytes on serial RX buffer: {!r}.'.format(data))
+                        self._drain_until = now + self._defaut_timeout
+                    elif now >= self._drain_until:
+                        self._end_drain(now)
+                    buf = b''
+                    continue
+                if not buf.endswith(b'\n'):
+                    if not (self._pending and self._pending[0].deadline < now):
+                        continue
+                    partial, buf = len(buf), b''
+                    failed = self._start_drain(now)
+                else:
+                    line, buf = buf.decode('ascii'), b''
+                    if not self._pending:
+                        self.logger.warning('There was some unexpected bytes on serial RX buffer: {}.'.format(line))
+                        continue
+                    self.logger.debug("Returned line: {!r}".format(line))
+                    head = self._pending[0]
+                    head.lines.append(line)
+                    head.deadline = now + head.wait
+                    if len(head.lines) < head.message.return_lines():
+                        continue
+                    done = self._pending.popleft()
+                    # the next outstanding message waits from now on
+                    if self._pending:
+                        self._pending[0].deadline = now + self._pending[0].wait
+            if failed is None:
+                done.resolve()
+            else:
+                failed[0].timeout(self.logger, partial)
+                for p in failed[1:]:
+                    p.future.set_exception(XL2Error('Answers discarded after timeout of {!r} message.'.format(
+                        str(failed[0].message))))
+
+    def send_message(self, message, wait=1):
+        """Send message without waiting for the answers.
+
+        Parameters
+        ----------
+        message : :obj:`ntixl2.message.Message` object
+        wait : float
+            timeout to wait for each answer line once the message is the next one to be answered.
+
+        Returns
+        -------
+        :class:`concurrent.futures.Future`
+            resolve to the parsed message answers (see :meth:`serial_message`)
+
+        Note
+        ----
+        If the reader thread is not running the message is sent with :meth:`serial_message` and the returned future
+        is already done.
+        """
+        future = Future()
+        if not self.reader_running:
+            try:
+                future.set_result(self.serial_message(message, wait))
+            except Exception as e:
+                future.set_exception(e)
+            return future
+
+        self.logger.debug("Send message {!r}.".format(str(message)))
+        data = str(message).encode('ascii')
+        pending = None if message.RETURN is None else _PendingMessage(message, wait, future)
+        with self._pending_lock:
+            if self._drain_until is not None:
+                self._held.append((data, pending))
+            else:
+                if pending is not None:
+                    self._pending.append(pending)
+                self.conn.write(data)
+        if pending is None:
+            future.set_result(None)
+        return future
+
     def serial_message(self, message, wait=1):
         """
 
@@ -123,8 +320,11 @@ class XL2SLM_serial(object):
         Note
         ----
         for messages with answers the connection read timeout is set to 5 seconds.
+        If the reader thread is running (see :meth:`start_reader`) the message goes through :meth:`send_message`.
 
         """
+        if self.reader_running:
+            return self.send_message(message, wait).result()
         # write message
         self.flush_serial()
         self.logger.debug("Send message {!r}.".format(str(message)))
@@ -136,14 +336,15 @@ class XL2SLM_serial(object):
             ret = []
             for i in range(message.return_lines()):
                 line = self.conn.readline()
-                if len(line):
+                if line.endswith(b'\n'):
                     ret.append(line.decode('ascii'))
                     self.logger.debug("Returned line: {!r}".format(line.decode('ascii')))
                 else:
                     self.conn.timeout = self._defaut_timeout
-                    self.logger.error(
-                        'After sending {} message expected some lines on RX serial. Recieved 0 bytes'.str(message))
-                    raise XL2Error('Expected some lines on RX serial. Recieved 0 bytes')
+                    err = 'Expected {} lines on RX serial. Received {} complete lines, {} bytes'.format(
+                        message.return_lines(), len(ret), sum(len(l) for l in ret) + len(line))
+                    self.logger.error('After sending {} message: {}.'.format(str(message), err))
+                    raise XL2Error(err)
             # reset timeout
             self.conn.timeout = self._defaut_timeout
             return message.parse_answers(ret)
@@ -206,8 +407,10 @@ class XL2SLM_serial(object):
         return self.serial_message(QUERY_IDN())
 
     def get_datetime(self):
-        date = self.serial_message(QUERY_SYSTEM_DATE(),1.5)
-        time = self.serial_message(QUERY_SYSTEM_TIME(),1.5)
+        # pipelined in one round trip if the reader thread is running
+        date = self.send_message(QUERY_SYSTEM_DATE(),1.5)
+        time = self.send_message(QUERY_SYSTEM_TIME(),1.5)
+        date, time = date.result(), time.result()
         date['year']+=2000
         return datetime(**{**date, **time})
 
@@ -6,6 +6,66 @@ The NTiXL2 device save report and logging files in .txt format.
 """
 
 from datetime import datetime
+import numpy as np
+
+
+class BroadbandLog(object):
+    """Columnar content of the *Broadband LOG Results* section.
+
+    Attributes
+    ----------
+    columns : list
+        sample column names (Date, Time, Timer and event columns removed)
+    units : list
+        sample column units
+    timestamps : numpy.ndarray
+        sample timestamps, dtype datetime64[s]
+    data : dict
+        column name -> numpy.ndarray. Numeric columns are float64 (NaN for empty cells), others are object arrays.
+    events : dict or None
+        events by event number, None if the log has no event columns
+
+    Note
+    ----
+    For compatibility the object can be indexed as the dict returned by previous versions:
+    ``log['samples_columns']``, ``log['samples_units']``, ``log['samples']``, ``log['events']``.
+    """
+
+    def __init__(self, columns, units, timestamps, data, events):
+        self.columns = columns
+        self.units = units
+        self.timestamps = timestamps
+        self.data = data
+        self.events = events
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def to_dataframe(self):
+        """Return a pandas.DataFrame view indexed by timestamp. pandas is imported only here."""
+        import pandas as pd
+        return pd.DataFrame(self.data, index=pd.DatetimeIndex(self.timestamps, name='timestamp'),
+                            columns=self.columns)
+
+    def samples(self):
+        """Return the samples as dict timestamp -> list of values (layout of previous versions)."""
+        cols = [[None if (isinstance(v, float) and v != v) else v for v in self.data[c].tolist()]
+                for c in self.columns]
+        return {t: list(row) for t, row in zip(self.timestamps.tolist(), zip(*cols))}
+
+    def __getitem__(self, key):
+        if key == 'samples_columns':
+            return self.columns
+        elif key == 'samples_units':
+            return self.units
+        elif key == 'samples':
+            return self.samples()
+        elif key == 'events':
+            return self.events
+        raise KeyError(key)
+
+
+BROADBAND_DATA_SECTION = "Broadband LOG Results"
 
 
 def parse_broadband_file(file_path, options={}):
@@ -19,36 +79,97 @@ def parse_broadband_file(file_path, options={}):
     Returns
     -------
     dict
-        A dictionary organized in sections containing metadata and a section for measurements
+        A dictionary organized in sections containing metadata and a section for measurements. The measurements
+        section *Broadband LOG Results* is a :class:`BroadbandLog`.
 
     """
     broadband_section_functions = {"Hardware Configuration": __parse_hardware_section,
                                    "Measurement Setup": __parse_measurement_setup_section,
                                    "Time": __parse_time_section,
-                                   "Broadband LOG Results": __parse_broadband_data_section,
+                                   BROADBAND_DATA_SECTION: __parse_broadband_data_section,
     }
 
     return __parse_file(file_path, broadband_section_functions)
 
 
-def __parse_file(file_path, function_dict):
-    # Split up data into sections
-    with open(file_path) as file:
-        raw_sections = file.read().split('#')
+def parse_broadband_file_header(file_path):
+    """Parse only the metadata sections of a broadband recording file.
+
+    Reading stops at the *Broadband LOG Results* section, so no sample row is read.
+
+    Parameters
+    ----------
+    file_path
+        The location of the broadband recording file to be parsed
+
+    Returns
+    -------
+    dict
+        A dictionary with the sections 'Title', 'Measurement' (file, Start, End), 'Hardware Configuration' and
+        'Measurement Setup'.
+
+    """
+    header_section_functions = {"Hardware Configuration": __parse_hardware_section,
+                                "Measurement Setup": __parse_measurement_setup_section,
+                                "Time": __parse_time_section,
+    }
+
+    return __parse_file(file_path, header_section_functions, stop_section=BROADBAND_DATA_SECTION)
+
+
+class _SectionReader(object):
+    """Read a XL2 text file section by section, line by line.
+
+    Sections start with a line beginning with '#'. Content lines are returned without the leading tab and end of
+    line, empty lines are skipped.
+    """
 
+    def __init__(self, file):
+        self._file = file
+        self._next_title = None
+        for line in file:
+            if line.startswith('#'):
+                self._next_title = line[1:].strip()
+                break
+
+    def _lines(self):
+        for line in self._file:
+            if line.startswith('#'):
+                self._next_title = line[1:].strip()
+                return
+            line = line.rstrip('\r\n')
+            if line.startswith('\t'):
+                line = line[1:]
+            if line.strip():
+                yield line
+
+    def sections(self):
+        """Yield (title, lines) for every section. lines is an iterator valid till the next section is requested."""
+        while self._next_title is not None:
+            title = self._next_title
+            self._next_title = None
+            lines = self._lines()
+            yield title, lines
+            for _ in lines:
+                pass
+
+
+def __parse_file(file_path, function_dict, stop_section=None):
     sections = {}
-    first_line = raw_sections.pop(0).split('\n')[0].split('\t')
-    sections['Title'] = first_line[0][:-1]
-    sections['Measurement'] = {'file':((first_line[2]).split("\\")[1]).strip()}
+    with open(file_path) as file:
+        first_line = file.readline().split('\t')
+        sections['Title'] = first_line[0][:-1]
+        sections['Measurement'] = {'file':((first_line[2]).split("\\")[1]).strip()}
 
-    for section in raw_sections:
-        # Split up sections into lines to parse
-        lines = [line for line in section.split('\n\t')]
-        section_title = lines.pop(0).strip()
-        sections[section_title] = lines
+        for section_title, lines in _SectionReader(file).sections():
+            if section_title == stop_section:
+                break
+            f = function_dict.get(section_title)
+            sections[section_title] = list(lines) if f is None else f(lines)
 
-    for key, f in function_dict.items():
-        sections[key] = f(sections[key])
+    for key in function_dict.keys():
+        if key not in sections:
+            raise KeyError(key)
 
     sections['Measurement'].update(sections.pop('Time'))
 
@@ -70,7 +191,7 @@ def __try_parse_cell_content(s):
                 return s
 
 def __parse_hardware_section(section_lines):
-    splitted_lines = [l.split('\t') for l in section_lines if l  is not ""]
+    splitted_lines = [l.split('\t') for l in section_lines if l]
     hardware_dict = {k.strip().replace(':',''): v.strip()  for k,v in splitted_lines }
     value, unit = hardware_dict.pop('Mic Sensitivity').split(" ")
     hardware_dict['Mic Sensitivity[{}]'.format(unit)] = float(value)
@@ -78,7 +199,7 @@ def __parse_hardware_section(section_lines):
 
 
 def __parse_measurement_setup_section(section_lines):
-    splitted_lines = [l.split('\t') for l in section_lines if l  is not ""]
+    splitted_lines = [l.split('\t') for l in section_lines if l]
     setup_dict = {k.strip().replace(':',''): v.strip()  for k,v in splitted_lines }
 
     value1,_,value2, unit = setup_dict.pop('Range').split(" ")
@@ -95,32 +216,66 @@ def __parse_time_section(section_lines):
     return section_dict
 
 
-def __parse_broadband_data_section(section_lines):
-    colnames = __line_to_list(section_lines.pop(0))
+class _Column(object):
+    """Growable column. float64 while all cells are numeric, object array otherwise."""
+
+    def __init__(self, capacity, parse_cell):
+        self.values = np.empty(capacity, dtype=np.float64)
+        self.numeric = True
+        self._parse_cell = parse_cell
+
+    def grow(self, capacity):
+        values = np.empty(capacity, dtype=self.values.dtype)
+        values[:len(self.values)] = self.values
+        self.values = values
+
+    def set(self, i, s):
+        if self.numeric:
+            if s == "":
+                self.values[i] = np.nan
+                return
+            try:
+                self.values[i] = float(s)
+                return
+            except ValueError:
+                values = np.empty(len(self.values), dtype=object)
+                values[:i] = [None if v != v else v for v in self.values[:i].tolist()]
+                self.values = values
+                self.numeric = False
+        self.values[i] = self._parse_cell(s)
+
+
+def __time_to_seconds(s):
+    # fast path for HH:MM:SS
+    if len(s) == 8 and s[2] == ':' and s[5] == ':':
+        return int(s[0:2]) * 3600 + int(s[3:5]) * 60 + int(s[6:8])
+    t = datetime.strptime(s, '%H:%M:%S').time()
+    return t.hour * 3600 + t.minute * 60 + t.second
+
+
+def __parse_broadband_data_section(section_lines, capacity=1024):
+    section_lines = iter(section_lines)
+    colnames = __line_to_list(next(section_lines))
     colnames_index={name:n for n,name in enumerate(colnames)}
     num_cols= len(colnames)
-    units = __line_to_list(section_lines.pop(0))
+    units = __line_to_list(next(section_lines))
 
     if 'Pause' in colnames:
         units[colnames.index('Pause')] = "[?]" # to correct the missing PAUSE unit
 
     assert len(units)==num_cols
 
-    #samples
-    samples = {}
-    samples_header_index = list(range(len(colnames)))
-
-
-
     columns_to_remove = ['Date','Time','Timer']
     #events handling
     evt_columns = [h for h in colnames if "Evt" in h]
     event = len(evt_columns) != 0
     if event:
         #remove events columns from output
-        events_colnames= ["Evt_Duration","Evt_Key1","Evt_Key2","Evt_Key3","Evt_Key4","Evt_WaveFile"]
         columns_to_remove += ["Evt_Duration","Evt_Lvl","Evt_Key1","Evt_Key2","Evt_Key3","Evt_Key4","Evt_WaveFile"]
         events = {}
+        evt_no_index = colnames_index['Evt_No']
+        evt_wav_index = colnames_index['Evt_WaveFile']
+        evt_duration_index = colnames_index['Evt_Duration']
     else:
         events=None
 
@@ -130,47 +285,63 @@ def __parse_broadband_data_section(section_lines):
     selected_colnames=[name for name in colnames if name not in columns_to_remove]
     selected_colnames_index=[colnames_index[name] for name in selected_colnames]
 
+    # preallocated columns, grown by doubling
+    timestamps = np.empty(capacity, dtype=np.int64)
+    columns = [_Column(capacity, __try_parse_cell_content) for _ in selected_colnames]
+    selected = list(zip(selected_colnames_index, columns))
+    day_seconds = {}  # date string -> epoch seconds of midnight
+
     last_evt=-1
     evt={}
+    n = 0
     ## iterate on rows
     for line in section_lines:
-        elements = __line_to_list(line)
+        cells = line.split('\t')
+        if n == capacity:
+            capacity *= 2
+            timestamps = np.resize(timestamps, capacity)
+            for c in columns:
+                c.grow(capacity)
 
         #compute timestamp
-        date = datetime.strptime(elements[date_index], '%Y-%m-%d').date()
-        time = datetime.strptime(elements[time_index], '%H:%M:%S').time()
-        timestamp = datetime.combine(date,time)
+        date = cells[date_index].strip()
+        day = day_seconds.get(date)
+        if day is None:
+            day = day_seconds[date] = int(np.datetime64(datetime.strptime(date, '%Y-%m-%d'), 's').astype(np.int64))
+        timestamps[n] = day + __time_to_seconds(cells[time_index].strip())
 
-        #filter elements
-        samples[timestamp] = [elements[i] for i in selected_colnames_index ]
+        for i, c in selected:
+            c.set(n, cells[i].strip() if i < len(cells) else "")
 
         #events
         if event:
+            elements = [__try_parse_cell_content(e.strip()) for e in cells]
             try:
-                event_n = int(elements[colnames_index['Evt_No']])
+                event_n = int(elements[evt_no_index])
             except:
                 event_n = None
             else:
                 if event_n>last_evt:
                     evt={}
                     last_evt= event_n
-                    evt['start']= timestamp
+                    evt['start']= np.datetime64(int(timestamps[n]), 's').astype(datetime)
                     evt['Evt_No']=event_n
                     evt['key'] = ["Evt_Key1","Evt_Key2","Evt_Key3","Evt_Key4"]
 
-                Evt_waw = elements[colnames_index['Evt_WaveFile']]
+                Evt_waw = elements[evt_wav_index]
 
                 #last event line contains the wav locatione
                 if (Evt_waw is not None) and (".wav" in Evt_waw):
                     evt["Evt_WaveFile"] = Evt_waw
-                    evt["Evt_Duration"] = elements[colnames_index['Evt_Duration']]
+                    evt["Evt_Duration"] = elements[evt_duration_index]
                     events[event_n]=evt
+        n += 1
 
-    return {"samples_columns":selected_colnames,
-            "samples_units": [units[i] for i in selected_colnames_index],
-            "samples":(samples),
-            "events": events
-            }
+    return BroadbandLog(columns=selected_colnames,
+                        units=[units[i] for i in selected_colnames_index],
+                        timestamps=timestamps[:n].copy().view('datetime64[s]'),
+                        data={name: c.values[:n].copy() for name, c in zip(selected_colnames, columns)},
+                        events=events)
 
 
 
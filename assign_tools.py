@@ -1,12 +1,17 @@
 import json
-from NTiXL2.ntixl2.xl2parser import parse_broadband_file
+import bisect
+import sqlite3
+import contextlib
+from NTiXL2.ntixl2.xl2parser import parse_broadband_file_header
 import datetime
 from pyLRM.passby import sync_str_to_datetime,xl2_time_correction
 from pathlib import Path
 import argparse
 import logging
 import sys,os
+import time
 import shutil
+from concurrent.futures import ThreadPoolExecutor
 import pandas as pd
 from bokeh.models import ColumnDataSource,Plot, LinearAxis, Grid, DatetimeTickFormatter,Range1d,LabelSet
 from bokeh.plotting import figure, show, output_notebook
@@ -15,6 +20,9 @@ import bokeh
 logging.basicConfig( stream=sys.stdout,format='%(funcName)-15s: %(message)s',level=logging.INFO)
 logger = logging.getLogger()
 
+# number of threads used to load passby and XL2 files
+DEFAULT_WORKERS = 4
+
 
 def delete_files(file_path_list):
     for f in file_path_list:
@@ -36,15 +44,45 @@ def load_passby_info(path):
         else:
             p_info['start_rec'] = sync_str_to_datetime(p['start_rec'])
             p_info['stop_rec'] = sync_str_to_datetime(p['stop_rec'])
+            p_info['sync_time'] = {k: sync_str_to_datetime(v) for k, v in p['sync_time'].items()}
+            p_info['errors'] = len(p.get('errors', []))
+            p_info['ax_counts'] = p.get('ax_counts', {})
         xl2_filename = p.get("xl2_filename_root")
         if xl2_filename is not None:
             p_info['xl2_filename_root'] = xl2_filename
     return p_info
 
 
-def load_passby_info_from_dir(passby_path, name_match ="*passby.json"):
-    passby_list = []
+def _safe_load(loader, path):
+    try:
+        return loader(path)
+    except Exception as e:
+        logger.exception("File {} generate exception {}".format(path, e), exc_info=e)
+        logger.warning("Skip  {}.".format(path.name))
+        return None
+
+
+def load_files(paths, loader, workers=DEFAULT_WORKERS):
+    """Apply loader to all paths with a pool of workers threads.
+
+    Results are in the order of paths. A file whose loader raise is skipped with a warning and gives None.
+    """
+    paths = list(paths)
+    if workers is None or workers <= 1 or len(paths) <= 1:
+        return [_safe_load(loader, p) for p in paths]
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(lambda p: _safe_load(loader, p), paths))
+
+
+def load_passby_info_from_dir(passby_path, name_match ="*passby.json", index=None, workers=DEFAULT_WORKERS):
+    """Load info of all passby files in passby_path. If index (:class:`MetadataIndex`) is given only new or
+    changed files are read."""
     logger.info("Load passbys from {}.".format(passby_path))
+    if index is not None:
+        passby_list = index.passby_infos(passby_path, name_match, workers=workers)
+    else:
+        passby_list = [p for p in load_files([fp for fp in passby_path.iterdir() if fp.match(name_match)],
+                                             load_passby_info, workers) if p is not None]
 
     #if "bemerkung.json" in [f.name for f in passby_path.iterdir()]:
     #    with passby_path.joinpath("bemerkung.json").open('r+') as file:
@@ -56,11 +94,6 @@ def load_passby_info_from_dir(passby_path, name_match ="*passby.json"):
     #    bem_d=None
     #    skip=[]
 
-    for fp in passby_path.iterdir():
-        if fp.match(name_match):
-            p_info = load_passby_info(fp)
-            if p_info is not None:
-                passby_list.append(p_info)
 
     if len(passby_list) == 0:
         raise Exception("No valid passby found in {}.".format(passby_path))
@@ -70,7 +103,7 @@ def load_passby_info_from_dir(passby_path, name_match ="*passby.json"):
 
 def load_xl2logs_info(path):
     rec_info = {}
-    log_measurement = parse_broadband_file(str(path))['Measurement']
+    log_measurement = parse_broadband_file_header(str(path))['Measurement']
     rec_info['stop_rec'] = log_measurement['End']
     rec_info['start_rec'] = log_measurement['Start']
     rec_info['path'] = path
@@ -78,19 +111,172 @@ def load_xl2logs_info(path):
     return  rec_info
 
 
-def load_xl2logs_from_dir(xl2_data_path):
-    rec_list=[]
+def load_xl2logs_from_dir(xl2_data_path, index=None, workers=DEFAULT_WORKERS):
+    """Load info of all XL2 logs in xl2_data_path. If index (:class:`MetadataIndex`) is given only new or
+    changed files are read."""
     logger.info("Load xl2 logs from {}.".format(xl2_data_path))
-    for fp in xl2_data_path.iterdir():
-        if fp.match("*123_Log.txt"):
-            rec_info =load_xl2logs_info(fp)
-            rec_list.append(rec_info)
+    if index is not None:
+        rec_list = index.xl2log_infos(xl2_data_path, workers=workers)
+    else:
+        rec_list = [r for r in load_files([fp for fp in xl2_data_path.iterdir() if fp.match("*123_Log.txt")],
+                                          load_xl2logs_info, workers) if r is not None]
     if len(rec_list) == 0:
         raise Exception("No records found in {}.".format(xl2_data_path))
     else:
         logger.info("Number of XL2 records found: {}.".format(len(rec_list)))
     return rec_list
 
+##########################
+##########################
+# metadata index
+
+class MetadataIndex(object):
+    """Persistent SQLite index of passby and XL2 log metadata.
+
+    Entries are keyed by file path and validated with mtime and size: only new or changed files are read again.
+    Entries of files no longer present in a loaded directory are removed.
+
+    Parameters
+    ----------
+    db_path : str or Path
+        SQLite database file, created if missing.
+    """
+    PASSBY = 'passby'
+    XL2LOG = 'xl2log'
+
+    def __init__(self, db_path):
+        self.db_path = Path(db_path)
+        self._conn = sqlite3.connect(self.db_path.as_posix())
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("""CREATE TABLE IF NOT EXISTS files (
+                                path TEXT PRIMARY KEY,
+                                dir TEXT NOT NULL,
+                                kind TEXT NOT NULL,
+                                mtime_ns INTEGER NOT NULL,
+                                size INTEGER NOT NULL,
+                                valid INTEGER NOT NULL,
+                                start_rec TEXT,
+                                stop_rec TEXT,
+                                sync_bbg TEXT,
+                                sync_xl2 TEXT,
+                                xl2_time_correction_us INTEGER,
+                                errors INTEGER,
+                                ax_counts TEXT,
+                                xl2_filename_root TEXT)""")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS files_dir ON files (dir, kind)")
+        self._conn.commit()
+
+    def close(self):
+        self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def passby_infos(self, passby_path, name_match="*passby.json", workers=DEFAULT_WORKERS):
+        """Return the infos of :func:`load_passby_info` for all valid passby files in passby_path."""
+        return self._load_dir(self.PASSBY, passby_path, name_match, load_passby_info, workers)
+
+    def xl2log_infos(self, xl2_data_path, workers=DEFAULT_WORKERS):
+        """Return the infos of :func:`load_xl2logs_info` for all XL2 logs in xl2_data_path."""
+        return self._load_dir(self.XL2LOG, xl2_data_path, "*123_Log.txt", load_xl2logs_info, workers)
+
+    def update(self, path):
+        """Read path again, e.g. after it was modified by :func:`update_passby_with_xl2_path`."""
+        path = Path(path).absolute()
+        kind, loader = ((self.PASSBY, load_passby_info) if path.name.endswith('.json')
+                        else (self.XL2LOG, load_xl2logs_info))
+        info = loader(path)
+        self._store(kind, path, path.stat(), info)
+        self._conn.commit()
+        return info
+
+    def _load_dir(self, kind, dir_path, name_match, loader, workers):
+        dir_path = Path(dir_path).absolute()
+        rows = {row['path']: row for row in
+                self._conn.execute("SELECT * FROM files WHERE dir=? AND kind=?", (dir_path.as_posix(), kind))}
+        files = []
+        to_read = []
+        for fp in dir_path.iterdir():
+            if not fp.match(name_match):
+                continue
+            st = fp.stat()
+            row = rows.pop(fp.as_posix(), None)
+            if row is not None and row['mtime_ns'] == st.st_mtime_ns and row['size'] == st.st_size:
+                files.append((fp, row))
+            else:
+                files.append((fp, st))
+                to_read.append(fp)
+        read = dict(zip(to_read, load_files(to_read, loader, workers)))
+        n_cached = 0
+        infos = []
+        for fp, row in files:
+            if fp in read:
+                info = read[fp]
+                self._store(kind, fp, row, info)
+            elif row['valid']:
+                info = self._row_to_info(kind, fp, row)
+                n_cached += 1
+            else:
+                logger.warning("Skip  {}.".format(fp.name))
+                info = None
+            if info is not None:
+                infos.append(info)
+        # files removed from dir
+        self._conn.executemany("DELETE FROM files WHERE path=?", [(p,) for p in rows])
+        self._conn.commit()
+        logger.info("{} files read, {} from index.".format(len(to_read), n_cached))
+        return infos
+
+    def _store(self, kind, path, st, info):
+        row = {'path': path.as_posix(), 'dir': path.parent.as_posix(), 'kind': kind, 'mtime_ns': st.st_mtime_ns,
+               'size': st.st_size, 'valid': int(info is not None), 'start_rec': None, 'stop_rec': None,
+               'sync_bbg': None, 'sync_xl2': None, 'xl2_time_correction_us': None, 'errors': None,
+               'ax_counts': None, 'xl2_filename_root': None}
+        if info is not None:
+            row['start_rec'] = str(info['start_rec'])
+            row['stop_rec'] = str(info['stop_rec'])
+            row['xl2_filename_root'] = info.get('xl2_filename_root')
+            if kind == self.PASSBY:
+                row['sync_bbg'] = str(info['sync_time']['BBG'])
+                row['sync_xl2'] = str(info['sync_time']['xl2'])
+                row['xl2_time_correction_us'] = info['xl2_time_correction'] // datetime.timedelta(microseconds=1)
+                row['errors'] = info['errors']
+                row['ax_counts'] = json.dumps(info['ax_counts'])
+        self._conn.execute("INSERT OR REPLACE INTO files ({}) VALUES ({})".format(
+            ", ".join(row.keys()), ", ".join("?" * len(row))), list(row.values()))
+
+    def _row_to_info(self, kind, path, row):
+        info = {'path': path,
+                'start_rec': sync_str_to_datetime(row['start_rec']),
+                'stop_rec': sync_str_to_datetime(row['stop_rec'])}
+        if kind == self.PASSBY:
+            info['xl2_time_correction'] = datetime.timedelta(microseconds=row['xl2_time_correction_us'])
+            info['sync_time'] = {'BBG': sync_str_to_datetime(row['sync_bbg']),
+                                 'xl2': sync_str_to_datetime(row['sync_xl2'])}
+            info['errors'] = row['errors']
+            info['ax_counts'] = json.loads(row['ax_counts'])
+            if row['xl2_filename_root'] is not None:
+                info['xl2_filename_root'] = row['xl2_filename_root']
+        else:
+            info['xl2_filename_root'] = row['xl2_filename_root']
+        return info
+
+
+@contextlib.contextmanager
+def open_index(index):
+    """Context manager yielding a :class:`MetadataIndex` for index (path or MetadataIndex), None if index is None.
+
+    An index opened from a path is closed on exit, a given MetadataIndex is left open.
+    """
+    if index is None or isinstance(index, MetadataIndex):
+        yield index
+        return
+    with MetadataIndex(index) as opened:
+        yield opened
+
 ##########################
 ##########################
 
@@ -104,24 +290,28 @@ def max_duration(rec_passby_list, max_duration):
             index.append(i)
     return index
 
-def test_XL2_duration(xl2_data_path,duration, delete=False):
-    rec_list = load_xl2logs_from_dir(xl2_data_path)
+def test_XL2_duration(xl2_data_path,duration, delete=False, index=None, workers=DEFAULT_WORKERS):
+    with open_index(index) as index:
+        rec_list = load_xl2logs_from_dir(xl2_data_path, index=index, workers=workers)
     outliers = max_duration(rec_list,duration)
     outliers= [rec_list[i]['path'] for i in outliers]
     logger.info("{} XL2 logs with duration > than {}.".format(len(outliers),duration))
     if delete:
         delete_files(outliers)
 
-def test_passby_duration(passby_path, duration, delete=False):
-    passby_list = load_passby_info_from_dir(passby_path,  "*passby.json")
+def test_passby_duration(passby_path, duration, delete=False, index=None, workers=DEFAULT_WORKERS):
+    with open_index(index) as index:
+        passby_list = load_passby_info_from_dir(passby_path,  "*passby.json", index=index, workers=workers)
     outliers = max_duration(passby_list,duration)
     logger.info("{} passby with duration > than {}.".format(len(outliers),duration))
     outliers= [passby_list[i]['path'] for i in outliers]
     if delete:
         delete_files(outliers)
 
-def test_passby_time_corrrection(passby_path, max_correction, max_deviation, delete=False):
-    passby_list = load_passby_info_from_dir(passby_path,  "*passby.json")
+def test_passby_time_corrrection(passby_path, max_correction, max_deviation, delete=False, index=None,
+                                 workers=DEFAULT_WORKERS):
+    with open_index(index) as index:
+        passby_list = load_passby_info_from_dir(passby_path,  "*passby.json", index=index, workers=workers)
     time_correction = []
     remaining_pb =[]
     out = []
@@ -181,24 +371,72 @@ def update_passby_with_xl2_path(path, xl2_filename_root):
     with path.open('w+') as file:
         json.dump(passby,file, sort_keys=True, indent=2, default=str)
 
+class XL2RecordIndex(object):
+    """XL2 records sorted by start time for fast overlap queries.
+
+    Overlap semantic is the one of :func:`has_time_overlap`. Records can be removed once assigned.
+    Records are referred to by their index in xl2_records.
+    """
+    def __init__(self, xl2_records):
+        self._records = xl2_records
+        self._order = sorted(range(len(xl2_records)), key=lambda i: xl2_records[i]['start_rec'])
+        self._starts = [xl2_records[i]['start_rec'] for i in self._order]
+        self._max_duration = max([r['stop_rec'] - r['start_rec'] for r in xl2_records] + [datetime.timedelta(0)])
+        self._removed = [False] * len(xl2_records)
+
+    def overlapping(self, start, stop, max_matches=None):
+        """Return index of the not removed records overlapping [start, stop] (uncorrected xl2 time)."""
+        matches = []
+        # only records starting in [start - max_duration, stop] can overlap
+        lo = bisect.bisect_left(self._starts, start - self._max_duration)
+        hi = bisect.bisect_right(self._starts, stop)
+        for i in self._order[lo:hi]:
+            r = self._records[i]
+            if not self._removed[i] and has_time_overlap(start, stop, r['start_rec'], r['stop_rec']):
+                matches.append(i)
+                if max_matches is not None and len(matches) >= max_matches:
+                    break
+        return matches
+
+    def remove(self, i):
+        self._removed[i] = True
+
+    def remaining(self):
+        """Return not removed records in original order."""
+        return [r for r, removed in zip(self._records, self._removed) if not removed]
+
+
+def passby_xl2_interval(start_rec, stop_rec, xl2_time_correction, **kwargs):
+    """Return start and stop of the passby in uncorrected xl2 time, same shift as :func:`assign_xl2rec_to_passby`"""
+    dt = datetime.timedelta(seconds=2)
+    return start_rec - dt - xl2_time_correction, stop_rec - dt - xl2_time_correction
+
+
 def assign_func(passby_list,rec_list):
+    """Assign to each passby the only overlapping xl2 record.
+
+    Passbys are handled in list order, an assigned record is not available for the following passbys.
+    Passbys overlapping more than one record are counted as not correctly assigned.
+    """
     assigned = []
-    rec_list=rec_list.copy()
+    index = XL2RecordIndex(rec_list)
     remaining_passby=[]
     assigned_rec = []
     not_correctly_assigned = 0
     for p in passby_list:
-        assigned_recs_index = assign_xl2rec_to_passby(**p, xl2_records=rec_list)
+        assigned_recs_index = index.overlapping(*passby_xl2_interval(**p), max_matches=2)
         n_assignements = len(assigned_recs_index)
         if n_assignements == 0:
             remaining_passby.append(p)
             logger.warning("Not assigned: {}, {}.".format(p['path'].parent.parent.name, p['path'].name))
         elif n_assignements == 1:
-            rec = rec_list.pop(assigned_recs_index[0])
+            index.remove(assigned_recs_index[0])
+            rec = rec_list[assigned_recs_index[0]]
             assigned.append((p,rec))
             assigned_rec.append(rec)
         elif n_assignements > 1:
             not_correctly_assigned += 1
+    rec_list = index.remaining()
 
     logger.info("Correctly assigned {}".format(len(assigned)))
     logger.info("Used recs {}".format(len(assigned_rec)))
@@ -250,17 +488,20 @@ def plot_zuordnung(assigned, remaining_passby, remaining_rec, labels=True, **kwa
     return plt
 
 
-def assign(passby_path,xl2_data_path,update_passby=False,plot=True):
-    passby_list = load_passby_info_from_dir(passby_path, "*passby.json")
-    rec_list = load_xl2logs_from_dir(xl2_data_path)
-    # assignement
-    logger.info("Start assigning XL2rec to passby.")
-    assigned, remaining_passby, remaining_rec= assign_func(passby_list,rec_list)
-
-    if update_passby:
-        logger.info("update passby with xl2_filename_root.")
-        for p,r in assigned:
-            update_passby_with_xl2_path(p['path'], r['xl2_filename_root'])
+def assign(passby_path,xl2_data_path,update_passby=False,plot=True, index=None, workers=DEFAULT_WORKERS):
+    with open_index(index) as index:
+        passby_list = load_passby_info_from_dir(passby_path, "*passby.json", index=index, workers=workers)
+        rec_list = load_xl2logs_from_dir(xl2_data_path, index=index, workers=workers)
+        # assignement
+        logger.info("Start assigning XL2rec to passby.")
+        assigned, remaining_passby, remaining_rec= assign_func(passby_list,rec_list)
+
+        if update_passby:
+            logger.info("update passby with xl2_filename_root.")
+            for p,r in assigned:
+                update_passby_with_xl2_path(p['path'], r['xl2_filename_root'])
+                if index is not None:
+                    index.update(p['path'])
     if plot:
         logger.info("generate plot.")
         p = plot_zuordnung(assigned, remaining_passby, remaining_rec, width=1500, height=200)
@@ -273,27 +514,124 @@ def assign(passby_path,xl2_data_path,update_passby=False,plot=True):
 ######################
 ######################
 
-def copy_files(file_path_list, path_destination):
-    if path_destination.is_dir():
-        for f in file_path_list:
-            new = shutil.copy(f.as_posix(), path_destination.as_posix())
-            logger.info("File {} copied at {}.".format(f.as_posix(),new))
-    else:
-        raise Exception('destination_path {} is not a directory'.format(path_destination.as_posix()))
+EXPORT_MODES = ['copy', 'hardlink', 'reflink', 'symlink']
+FICLONE = 0x40049409  # linux ioctl, clone file extents (btrfs, xfs)
 
-def passby_dir_name_and_file_to_move(passby, remaining_xl2):
+
+def _reflink(src, dst):
+    """Clone src to dst sharing the data blocks. Fall back to an in kernel copy (copy_file_range)."""
+    with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+        try:
+            import fcntl
+            fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+        except (ImportError, OSError):
+            size = os.fstat(fsrc.fileno()).st_size
+            copied = 0
+            while copied < size:
+                n = os.copy_file_range(fsrc.fileno(), fdst.fileno(), size - copied)
+                if n == 0:
+                    break
+                copied += n
+    shutil.copystat(src, dst)
+
+
+def export_file(f, path_destination, mode='copy'):
+    """Copy, hard link, reflink or symlink file f into directory path_destination.
+
+    Link modes fall back to a copy if the link can not be created (e.g. other file system). Passby json files are
+    never hard linked: assign -update_passby rewrites them in place, the edit would show up in the export too.
+    Return the new path and the file size.
+    """
+    new = path_destination.joinpath(f.name)
+    size = f.stat().st_size
+    if mode == 'hardlink' and f.suffix == '.json':
+        mode = 'copy'
+        if new.exists() and new.samefile(f):
+            # hard link of an earlier export
+            new.unlink()
+    if mode != 'copy':
+        if new.exists() and new.samefile(f):
+            logger.info("File {} already at {}.".format(f.as_posix(), new.as_posix()))
+            return new, size
+        if new.is_symlink() or new.exists():
+            new.unlink()
+        try:
+            if mode == 'hardlink':
+                os.link(f.as_posix(), new.as_posix())
+            elif mode == 'symlink':
+                os.symlink(f.absolute().as_posix(), new.as_posix())
+            elif mode == 'reflink':
+                _reflink(f.as_posix(), new.as_posix())
+            else:
+                raise ValueError("mode has to be in {}".format(EXPORT_MODES))
+        except (OSError, AttributeError) as e:
+            logger.warning("{} of {} failed ({}). Copy file.".format(mode, f.as_posix(), e))
+        else:
+            logger.info("File {} {} at {}.".format(f.as_posix(), mode, new.as_posix()))
+            return new, size
+    new = shutil.copy(f.as_posix(), path_destination.as_posix())
+    logger.info("File {} copied at {}.".format(f.as_posix(),new))
+    return Path(new), size
+
+
+def export_files(jobs, mode='copy', workers=DEFAULT_WORKERS):
+    """Export files with a pool of workers threads. jobs is a list of (file_path_list, path_destination).
+
+    Log and return the number of files, bytes and the throughput in MB/s.
+    """
+    tasks = []
+    for file_path_list, path_destination in jobs:
+        if not path_destination.is_dir():
+            raise Exception('destination_path {} is not a directory'.format(path_destination.as_posix()))
+        tasks += [(f, path_destination) for f in file_path_list]
+    t0 = time.monotonic()
+    if workers is None or workers <= 1:
+        results = [export_file(f, d, mode) for f, d in tasks]
+    else:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(lambda t: export_file(t[0], t[1], mode), tasks))
+    dt = time.monotonic() - t0
+    n_bytes = sum(size for _, size in results)
+    throughput = n_bytes / 1e6 / dt if dt > 0 else float('inf')
+    logger.info("Exported ({}) {} files, {:.1f} MB in {:.1f} s: {:.1f} MB/s.".format(
+        mode, len(results), n_bytes / 1e6, dt, throughput))
+    return len(results), n_bytes, throughput
+
+
+def copy_files(file_path_list, path_destination, mode='copy', workers=1):
+    return export_files([(file_path_list, path_destination)], mode=mode, workers=workers)
+
+def xl2_files_by_root(xl2_data_path, xl2_filename_roots):
+    """Return dict root -> list of the files in xl2_data_path whose name start with root.
+
+    The directory is read once. Name prefixes ending before a '_' or '.' are looked up in the set of roots, if
+    many roots match the longest wins.
+    """
+    roots = set(xl2_filename_roots)
+    files = {}
+    for fp in xl2_data_path.iterdir():
+        name = fp.name
+        root = None
+        for i, c in enumerate(name):
+            if (c == '_' or c == '.') and name[:i] in roots:
+                root = name[:i]
+        if root is None and name in roots:
+            root = name
+        if root is not None:
+            files.setdefault(root, []).append(fp)
+    return files
+
+def passby_dir_name_and_file_to_move(passby, xl2_files):
+    """xl2_files is the dict returned by :func:`xl2_files_by_root`. Files are moved out of it."""
     xl2_name_root= passby['xl2_filename_root']
     files_to_copy = [passby['path'].absolute()]
     dir_name = passby['path'].name.replace(".json","")
-    index=[]
-    for i,p in enumerate(remaining_xl2.copy()):
-        if p.match("*{}*".format(xl2_name_root)):
-            files_to_copy.append(p)
-            remaining_xl2.remove(p)
+    files_to_copy += xl2_files.pop(xl2_name_root, [])
     return dir_name, files_to_copy
 
-def copy(passby_path,xl2_data_path,new_path):
-    passby_list = load_passby_info_from_dir(passby_path, "*passby.json")
+def copy(passby_path,xl2_data_path,new_path, mode='copy', index=None, workers=DEFAULT_WORKERS):
+    with open_index(index) as index:
+        passby_list = load_passby_info_from_dir(passby_path, "*passby.json", index=index, workers=workers)
     flt_pb=[]
     for p in passby_list:
         try:
@@ -305,13 +643,15 @@ def copy(passby_path,xl2_data_path,new_path):
 
     new_path.mkdir(exist_ok=True)
     logger.info("{} passby dir to create at {}.".format(len(flt_pb),new_path.as_posix()))
-    xl2_data_paths=[p for p in xl2_data_path.iterdir()]
+    xl2_files = xl2_files_by_root(xl2_data_path, [p['xl2_filename_root'] for p in flt_pb])
+    jobs = []
     for p in flt_pb:
-        dir_name,files = passby_dir_name_and_file_to_move(p,xl2_data_paths)
+        dir_name,files = passby_dir_name_and_file_to_move(p,xl2_files)
         d = new_path.joinpath(dir_name)
         logger.info("create dir {}.".format(str(d)))
         d.mkdir(exist_ok=True)
-        copy_files(files,d)
+        jobs.append((files, d))
+    export_files(jobs, mode=mode, workers=workers)
 
 
 
@@ -319,6 +659,10 @@ def copy(passby_path,xl2_data_path,new_path):
 
 if __name__=="__main__":
     parser = argparse.ArgumentParser(prog='PROG', description ='Tool für Zuordnung zwischen XL2-Daten und Passby Daten.')
+    parser.add_argument('-index', type=lambda p: Path(p).absolute(), default=None,
+                        help='SQLite metadata index file. Only new or changed passby and XL2 files are read.')
+    parser.add_argument('-workers', type=int, default=DEFAULT_WORKERS,
+                        help='Number of threads loading passby and XL2 files. Default: {}'.format(DEFAULT_WORKERS))
     subparsers = parser.add_subparsers(help='sub-command help')
 
     parser_XL2_duration = subparsers.add_parser('test_XL2_duration', help='')
@@ -350,6 +694,9 @@ if __name__=="__main__":
     parser_copy.add_argument('passby_path', type=lambda p: Path(p).absolute(), help='Pfad von passby Data.')
     parser_copy.add_argument('xl2_data_path', type=lambda p: Path(p).absolute(), help='Pfad von XL2 Data.')
     parser_copy.add_argument('new_path', type=lambda p: Path(p).absolute(), help='Pfad wo das neue filesystem herstellt wird.')
+    parser_copy.add_argument('-mode', choices=EXPORT_MODES, default='copy',
+                             help='copy: kopieren, hardlink/reflink/symlink: ohne zusätzlichen Speicherplatz '
+                                  '(passby json werden bei hardlink kopiert). Default: copy')
     parser_copy.set_defaults(func=copy)
 
 
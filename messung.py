@@ -1,30 +1,34 @@
 from digi.xbee.devices import XBeeDevice
 import time
 import pathlib
-from pyLRM.axle_sensor import parse_msg, unstuff_frame_from_serial_data, init_axle_sensors_network,setup_axle_sensors
-from datetime import datetime
+import asyncio
+from pyLRM.axle_sensor import init_axle_sensors_network,setup_axle_sensors, AxleSensorException, \
+    save_axle_sensors_snapshot
+from pyLRM.acquisition import AcquisitionEngine
+from pyLRM.passby_store import PassbyStore
+from pyLRM.clock import system_clock
+from pyLRM.axle_journal import AxleJournal
 import pyLRM.config as config
-from pyLRM.config import xbee_axle_sensors_name_from_addr
 from pyLRM.config import MyTrainPassby as TrainPassby
-from pyLRM.logging_handler import init_logger, ax_sensor_log_gen,init_mail_logger
+from pyLRM.logging_handler import init_logger, init_mail_logger
 import argparse
-from queue import Queue
 from ntixl2 import XL2SLM_serial
-from ntixl2.message import INITIATE
 
 
 
-def main(logger,profile,stop_delay,passbypath, axsettings,stop_time):
+def main(logger,profile,stop_delay,passbypath, axsettings,stop_time, export_json=True, text_log=True):
 
     logger.info("========================")
     logger.info("===Init XL2.")
 
+    engine = None
     try:
         xl2 = XL2SLM_serial.from_usb_id(ids=config.XL2['serial_usb_id'],logger=logger)
         xl2.open()
         logger.info("Open XL2 ok.")
         logger.info("Setup XL2 measurement profile.")
         xl2.select_profile(profile=profile)
+        xl2.start_reader()
 
 
         logger.info("===Init Xbee coordinator.")
@@ -45,109 +49,31 @@ def main(logger,profile,stop_delay,passbypath, axsettings,stop_time):
         while xnet.is_discovery_running():
             time.sleep(0.5)
             #
-        axle_sensors = init_axle_sensors_network(xnet.get_devices(), config.xbee_axle_sensors,logger)
+        axle_sensors = init_axle_sensors_network(xnet.get_devices(), config.xbee_axle_sensors,logger,
+                                                 registry=config.axle_sensors_registry)
 
         # setup axle_sensors
         sum_len, thresholdON, thresholdOFF, thresholdERR = axsettings
-        setup_axle_sensors(axle_sensors, logger,
-                           sum_len=sum_len,
-                           thresholdOFF=thresholdOFF,
-                           thresholdON=thresholdON,
-                           thresholdERR=thresholdERR)
-        # define globals variables
-        g_msg_Q = Queue(100)
-        g_unstuff_frame = unstuff_frame_from_serial_data()  # generator used only in xbee thread(not thread safe!)
-        g_unstuff_frame.send(None)
-        # init log generator
-        ax_log_gen = ax_sensor_log_gen(logger, config.xbee_axle_sensors_names)
-        ax_log_gen.send(None)
-        #
-        def data_receive_callback(xbee_message):
-            """unstuuff frames parse msg and log message"""
-            from_address = xbee_message.remote_device.get_64bit_addr()
-            frames = g_unstuff_frame.send(xbee_message.data)
-            for frame in frames:
-                try:
-                    msg = parse_msg(frame)
-                    g_msg_Q.put([msg, from_address, datetime.now()])
-                    #
-                except Exception as e:
-                    logger.critical(e)
-
-        npassby = 0
-        clear_log_counter = False
-        passby = TrainPassby(axle_sensors_names=list(config.xbee_axle_sensors_names),
-                             stop_delay=stop_delay, ax_counter_low_err=4)
-        logger.info("Add callback.")
-        coord_xbee.add_data_received_callback(data_receive_callback)
-        ##
-        logger.info("Poll for data waiting for axle events.")
-        REC = False
-        while True:
-            time.sleep(0.001)
-            if not g_msg_Q.empty():
-                msg, from_address, timestamp= g_msg_Q.get()
-                ax_name = xbee_axle_sensors_name_from_addr(from_address)
-                ax_log_gen.send([msg, from_address, timestamp, clear_log_counter])
-                if clear_log_counter:
-                    clear_log_counter =False
-                passby.add_axle_data(**{**msg,'ax_name':ax_name,'timestamp':timestamp})
-            ##start stop rec
-            if passby.rec():
-                if not REC:
-                    REC=True
-                    try:
-                        xl2.serial_message(INITIATE.START()) #TODO: diesem befehl steckt hinten Viele Probleme
-                    except Exception as e:
-                        logger.error("Error start.{}.".format(str(e)))
-                        raise e
-                    else:
-                        passby.set_rec_start_time()
-                        logger.info("Start rec {}.".format(passby._name))
-            else:
-                if REC:
-                    REC=False
-                    try:
-                        xl2.serial_message(INITIATE.STOP()) #TODO: diesem befehl steckt hinten Viele Probleme
-                    except Exception as e:
-                        logger.error("Error  stop.{}.".format(str(e)))
-                        raise e
-                    else:
-                        passby.set_rec_stop_time()
-
-                    time.sleep(2)
-                    try:
-                        xl2time=xl2.get_datetime()
-                    except Exception as e:
-                        logger.error("Error xl2.get_datetime. Error{}.".format(str(e)))
-                        try:
-                            xl2time=xl2.get_datetime() #TODO: diesem befehl steckt Hinten Viele Probleme
-                        except Exception as e:
-                            logger.error("Error N.2 xl2.get_datetime. Error{}.".format(str(e)))
-                            raise e
-
-                    passby.set_xl2_BBG_sync_time(xl2time)
-                    passby.export(path=passbypath)
-                    if passby.is_error:
-                        logger.error("Stop rec {}.Passby has error".format(passby._name))
-                    else:
-                        logger.info("Stop rec {}.".format(passby._name))
-                    #new passby
-                    npassby += 1
-                    passby = TrainPassby(axle_sensors_names=list(config.xbee_axle_sensors_names),
-                                         stop_delay=15, ax_counter_low_err=4)
-                    clear_log_counter=True
-                elif passby.is_error:
-                    passby.export(path=passbypath)
-                    logger.error("Error passby {}. No REC. Reset.".format(passby._name))
-                    npassby += 1
-                    passby = TrainPassby( axle_sensors_names=list(config.xbee_axle_sensors_names),
-                                         stop_delay=stop_delay, ax_counter_low_err=4)
-                    clear_log_counter = True
-
-                elif datetime.now()>stop_time:
-                    logger.warning("Exit measuremet . Reached stop time.")
-                    break
+        report = setup_axle_sensors(axle_sensors, logger,
+                                    sum_len=sum_len,
+                                    thresholdOFF=thresholdOFF,
+                                    thresholdON=thresholdON,
+                                    thresholdERR=thresholdERR)
+        save_axle_sensors_snapshot(axle_sensors, passbypath.joinpath("axle_sensors.jsonl"))
+        failed = [name for name, r in report.items() if not r.ok]
+        if failed:
+            raise AxleSensorException("Setup of axle sensors {} failed.".format(failed))
+        # configured sensors only, sensors added to the registry at runtime are logged but do not trigger
+        passby_names = list(config.axle_sensors_registry.names)
+        passby_factory = lambda: TrainPassby(axle_sensors_names=list(passby_names),
+                                             stop_delay=stop_delay, ax_counter_low_err=4, clock=system_clock)
+        engine = AcquisitionEngine(coord_xbee, xl2, logger, passby_factory, passbypath, stop_time,
+                                   store=PassbyStore(passbypath.joinpath("passby_store")), export_json=export_json,
+                                   journal=AxleJournal(passbypath.joinpath("axle_events.journal"),
+                                                       config.axle_sensors_registry.names),
+                                   text_log=text_log, axle_sensors=axle_sensors, clock=system_clock)
+        logger.info("Wait for axle events.")
+        asyncio.get_event_loop().run_until_complete(engine.run())
 
     except KeyboardInterrupt as e:
         logger.warning('===Exit by KeyboardInterrupt')
@@ -159,14 +85,15 @@ def main(logger,profile,stop_delay,passbypath, axsettings,stop_time):
         logger.info('Put axle_sensors in idle state.')
         for ax in axle_sensors:
             ax.set_idle()
+        if engine is not None:
+            # last_seen of the sensors at the end of the measurement
+            save_axle_sensors_snapshot(axle_sensors, passbypath.joinpath("axle_sensors.jsonl"))
         # close serial connections
         logger.info('Close xbee serial connection.')
         coord_xbee.close()
         try:
-            if REC:
-                logger.error('Stop_measurement')
-                xl2.serial_message(INITIATE.STOP())
-                passby.export(passbypath, force=True)
+            if engine is not None:
+                engine.close()
             xl2.reset()
         finally:
             logger.info('Close xl2 serial connection.')
@@ -193,6 +120,14 @@ if __name__=="__main__":
                         help='Stop passby after {} seconds.'.format(config.STOP_DELAY)
                         )
 
+    parser.add_argument('-no_json', action='store_true',
+                        help='Do not export passby as json files. Passby are stored only in the columnar passby_store.')
+    parser.add_argument('-no_ax_text_log', action='store_true',
+                        help='Do not log axle events as text. Axle events are stored only in axle_events.journal.')
+    parser.add_argument('-log_max_mb', default=0, type=int,
+                        help='Rotate LRM_messung.log when it reaches this size in MB. Default 0: no rotation.')
+    parser.add_argument('-log_backups', default=0, type=int,
+                        help='Number of rotated log files to keep.')
     args = parser.parse_args()
 
     path = pathlib.Path(args.name).absolute()
@@ -201,7 +136,9 @@ if __name__=="__main__":
 
     logger = init_logger(pathlib.Path(__file__).name.split(".py")[0],
                          filepath=path,
-                         level=("DEBUG" if args.log_debug else "INFO"))
+                         level=("DEBUG" if args.log_debug else "INFO"),
+                         max_bytes=args.log_max_mb * 1024 * 1024,
+                         backup_count=args.log_backups)
 
     maillogger = init_mail_logger("mail")
 
@@ -213,7 +150,8 @@ if __name__=="__main__":
     while i<10:
         try:
             r = main(logger,profile=config.PROFILE,stop_delay=args.stop_delay, passbypath=path,
-                 axsettings=args.ax_sensor_settings,stop_time=config.STOP)
+                 axsettings=args.ax_sensor_settings,stop_time=config.STOP, export_json=not args.no_json,
+                 text_log=not args.no_ax_text_log)
 
         except Exception as e:
             i+=1
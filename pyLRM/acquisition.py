@@ -0,0 +1,251 @@
+import asyncio
+from ntixl2.message import INITIATE
+from pyLRM.axle_sensor import FrameDecoder, AxleEvent, parse_frames
+from pyLRM.logging_handler import ax_sensor_log_gen
+import pyLRM.config as config
+from pyLRM.clock import system_clock
+
+
+class AcquisitionEngine(object):
+    """asyncio acquisition core of the measurement.
+
+    The xbee receive path, the passby state machine and the XL2 command channel run as separate tasks connected by
+    bounded queues:
+
+    - xbee callback thread: unstuff and parse frames, hand messages to the event loop (axle queue)
+    - passby task: log axle events, feed :class:`pyLRM.passby.TrainPassby`, decide start/stop of the recording
+    - XL2 task: send start/stop to the XL2, read the XL2 time and export the passby
+
+    The blocking XL2 serial calls run in an executor, so axle ingestion never waits on XL2 serial I/O. A new passby
+    is created as soon as the previous one stops, axle events of the next train are collected while the XL2 is
+    still stopped and queried.
+
+    Parameters
+    ----------
+    coord_xbee : XBeeDevice
+        open coordinator xbee
+    xl2 : :class:`ntixl2.XL2SLM_serial`
+        open XL2 device
+    passby_factory : callable
+        return a new :class:`pyLRM.passby.TrainPassby`
+    passbypath : pathlib.Path
+        directory where passby are exported
+    stop_time : datetime.datetime
+        end of the measurement
+    store : :class:`pyLRM.passby_store.PassbyStore`
+        columnar store where passbys are appended, None to disable
+    export_json : bool
+        export each passby also as json file in passbypath
+    journal : :class:`pyLRM.axle_journal.AxleJournal`
+        binary journal of the axle events, synced at passby boundaries. None to disable.
+    text_log : bool
+        log axle events as text rows (errors are always logged)
+    registry : :class:`pyLRM.axle_sensor.AxleSensorRegistry`
+        known axle sensors, default config.axle_sensors_registry. Msg of unknown xbee are skipped.
+    axle_sensors : list
+        :class:`pyLRM.axle_sensor.AxleSensor` whose last_seen is updated on every received xbee message
+    clock : :class:`pyLRM.clock.SystemClock`
+        time source of the engine, should be the clock of the passbys. Re-anchored to the wall time between
+        passbys.
+    """
+
+    def __init__(self, coord_xbee, xl2, logger, passby_factory, passbypath, stop_time, axle_queue_size=100,
+                 xl2_queue_size=10, store=None, export_json=True, journal=None,
+                 text_log=True, registry=None, axle_sensors=None, clock=None):
+        self._xbee = coord_xbee
+        self._xl2 = xl2
+        self._logger = logger.getChild(self.__class__.__name__)
+        self._log = logger
+        self._passby_factory = passby_factory
+        self.passbypath = passbypath
+        self.stop_time = stop_time
+        self.store = store
+        self.export_json = export_json
+        self.journal = journal
+        self.text_log = text_log
+        self.registry = config.axle_sensors_registry if registry is None else registry
+        self.clock = system_clock if clock is None else clock
+        # sensor index -> AxleSensor
+        self._axle_sensors = {self.registry.index(ax.get_64bit_addr()): ax for ax in axle_sensors or []}
+        self._axle_queue_size = axle_queue_size
+        self._xl2_queue_size = xl2_queue_size
+        self._decoder = FrameDecoder()  # used only in xbee thread
+        self._loop = None
+        self._axle_q = None
+        self._xl2_q = None
+        self.npassby = 0
+        self.lost_msg = 0
+        self.unknown_msg = 0
+        # passby currently recorded by the XL2, None if XL2 is not recording
+        self.rec_passby = None
+
+    @property
+    def rec(self):
+        return self.rec_passby is not None
+
+    # xbee thread
+    def _data_receive_callback(self, xbee_message):
+        """unstuff frames, parse msg and pass them with the sensor index to the event loop"""
+        timestamp = self.clock.now()
+        key = bytes(xbee_message.remote_device.get_64bit_addr().address)
+        sensor = self.registry.index_of_key(key)
+        if sensor is None:
+            self.unknown_msg += 1
+            self._logger.error("Msg from unknown xbee {}. Skipped.".format(key.hex()))
+            return
+        ax = self._axle_sensors.get(sensor)
+        if ax is not None:
+            ax.mark_seen(timestamp)
+        frames = self._decoder.decode(xbee_message.data, key)
+        for msg in parse_frames(frames, on_error=lambda frame, e: self._logger.critical(e)):
+            self._loop.call_soon_threadsafe(self._put_axle_msg, (msg, sensor, timestamp))
+
+    def _put_axle_msg(self, item):
+        try:
+            self._axle_q.put_nowait(item)
+        except asyncio.QueueFull:
+            self.lost_msg += 1
+            self._logger.error("Axle queue full. Lost msg {}.".format(item))
+
+    # tasks
+    async def _passby_task(self):
+        ax_log_gen = ax_sensor_log_gen(self._log, self.registry, self.journal, self.text_log)
+        ax_log_gen.send(None)
+        clear_log_counter = False
+        rec = False
+        passby = self._passby_factory()
+        while True:
+            # sleep till next axle msg, passby stop or measurement stop time
+            deadline = passby.next_deadline() or self.stop_time
+            timeout = max(0., (deadline - self.clock.now()).total_seconds())
+            try:
+                msg, sensor, timestamp = await asyncio.wait_for(self._axle_q.get(), timeout)
+            except asyncio.TimeoutError:
+                pass
+            else:
+                ax_name = self.registry.names[sensor]
+                ax_log_gen.send([msg, sensor, timestamp, clear_log_counter])
+                clear_log_counter = False
+                if isinstance(msg, AxleEvent):
+                    passby.add_axle_data(ax_name, msg, timestamp)
+            ##start stop rec
+            if passby.rec():
+                if not rec:
+                    rec = True
+                    await self._xl2_q.put(('start', passby))
+            elif rec:
+                rec = False
+                await self._xl2_q.put(('stop', passby))
+                passby = self._new_passby()
+                clear_log_counter = True
+            elif passby.is_error:
+                self._export(passby)
+                self._logger.error("Error passby {}. No REC. Reset.".format(passby._name))
+                passby = self._new_passby()
+                clear_log_counter = True
+            elif self.clock.now() > self.stop_time:
+                self._logger.warning("Exit measuremet . Reached stop time.")
+                await self._xl2_q.put(None)
+                return
+
+    def _export(self, passby):
+        if self.store is not None:
+            self.store.append(passby)
+        if self.export_json:
+            passby.export(path=self.passbypath)
+
+    def _new_passby(self):
+        self.npassby += 1
+        if self.journal is not None:
+            self.journal.sync()
+        self.clock.resync()
+        return self._passby_factory()
+
+    async def _xl2_call(self, func, *args):
+        return await self._loop.run_in_executor(None, func, *args)
+
+    async def _xl2_task(self):
+        while True:
+            cmd = await self._xl2_q.get()
+            if cmd is None:
+                return
+            action, passby = cmd
+            if action == 'start':
+                await self._xl2_start(passby)
+            else:
+                await self._xl2_stop(passby)
+
+    async def _xl2_start(self, passby):
+        try:
+            await self._xl2_call(self._xl2.serial_message, INITIATE.START())
+        except Exception as e:
+            self._logger.error("Error start.{}.".format(str(e)))
+            raise e
+        else:
+            self.rec_passby = passby
+            passby.set_rec_start_time()
+            self._logger.info("Start rec {}.".format(passby._name))
+
+    async def _xl2_stop(self, passby):
+        try:
+            await self._xl2_call(self._xl2.serial_message, INITIATE.STOP())
+        except Exception as e:
+            self._logger.error("Error  stop.{}.".format(str(e)))
+            raise e
+        else:
+            self.rec_passby = None
+            passby.set_rec_stop_time()
+
+        await asyncio.sleep(2)
+        try:
+            xl2time = await self._xl2_call(self._xl2.get_datetime)
+        except Exception as e:
+            self._logger.error("Error xl2.get_datetime. Error{}.".format(str(e)))
+            try:
+                xl2time = await self._xl2_call(self._xl2.get_datetime)
+            except Exception as e:
+                self._logger.error("Error N.2 xl2.get_datetime. Error{}.".format(str(e)))
+                raise e
+
+        passby.set_xl2_BBG_sync_time(xl2time)
+        self._export(passby)
+        if passby.is_error:
+            self._logger.error("Stop rec {}.Passby has error".format(passby._name))
+        else:
+            self._logger.info("Stop rec {}.".format(passby._name))
+
+    def close(self, export_pending=True):
+        """Stop a running XL2 recording, export its passby (export_pending) and close store and journal.
+
+        Called after :meth:`run` returned or raised, from the thread of the measurement script.
+        """
+        passby, self.rec_passby = self.rec_passby, None
+        try:
+            if passby is not None:
+                self._logger.error('Stop_measurement')
+                self._xl2.serial_message(INITIATE.STOP())
+                passby.set_rec_stop_time()
+                if export_pending:
+                    self._export(passby)
+        finally:
+            if self.store is not None:
+                self.store.close()
+            if self.journal is not None:
+                self.journal.close()
+
+    async def run(self):
+        """Run until stop_time is reached or a task raise an exception."""
+        # the wall time may have been stepped (NTP) since the clock was anchored, e.g. at import
+        self.clock.resync()
+        self._loop = asyncio.get_event_loop()
+        self._axle_q = asyncio.Queue(self._axle_queue_size)
+        self._xl2_q = asyncio.Queue(self._xl2_queue_size)
+        self._logger.info("Add callback.")
+        self._xbee.add_data_received_callback(self._data_receive_callback)
+        tasks = [asyncio.ensure_future(self._passby_task()), asyncio.ensure_future(self._xl2_task())]
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            self._xbee.del_data_received_callback(self._data_receive_callback)
+            for t in tasks:
+                t.cancel()
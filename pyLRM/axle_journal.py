@@ -0,0 +1,158 @@
+import datetime
+import json
+import os
+import pathlib
+import struct
+import numpy as np
+
+# Append-only binary journal of axle events.
+#
+# File layout: HEADER_SIZE bytes header (MAGIC + json with version, sensor names and record size, padded with
+# spaces) followed by fixed-size little endian records (RECORD_DTYPE). A partial record at the end of the file
+# (crash while writing) is ignored by the reader.
+
+MAGIC = b"LRMAXJ\x00\x01"
+HEADER_SIZE = 256
+VERSION = 1
+
+# timestamp: ns since epoch (naive local time), wheel_on = -1 for MSG_HEADER_AXLE_ERROR
+RECORD_DTYPE = np.dtype([("timestamp", "<i8"),
+                         ("ax_number", "<u4"),
+                         ("wheel_off", "<u4"),
+                         ("wheel_on", "<i4"),
+                         ("sensor", "<u2"),
+                         ("header", "u1"),
+                         ("pad", "u1")])
+_RECORD = struct.Struct("<qIIiHBx")
+assert _RECORD.size == RECORD_DTYPE.itemsize
+
+_EPOCH = datetime.datetime(1970, 1, 1)
+_US = datetime.timedelta(microseconds=1)
+
+
+class AxleJournalException(Exception):
+    pass
+
+
+def _read_header(f):
+    head = f.read(HEADER_SIZE)
+    if len(head) < HEADER_SIZE or not head.startswith(MAGIC):
+        raise AxleJournalException("{} is not an axle journal.".format(f.name))
+    meta = json.loads(head[len(MAGIC):].decode().strip())
+    if meta["version"] != VERSION or meta["record_size"] != RECORD_DTYPE.itemsize:
+        raise AxleJournalException("Unsupported axle journal version {}.".format(meta["version"]))
+    return meta
+
+
+class AxleJournal(object):
+    """Writer of the axle event journal.
+
+    Records are buffered, :meth:`sync` flushes and fsyncs them (called at passby boundaries).
+
+    Parameters
+    ----------
+    path : pathlib.Path
+        journal file, appended if it exists
+    sensors : list
+        axle sensor names by sensor index of :meth:`append` (e.g.
+        :attr:`pyLRM.axle_sensor.AxleSensorRegistry.names`). The list may grow while writing. The header keeps the
+        names of the journal, the record sensor field is the index in the header names: names not yet in the
+        header are appended to it, so a journal can be continued with other or more sensors.
+    buffering : int
+        write buffer size in bytes
+    """
+
+    def __init__(self, path, sensors, buffering=64 * 1024):
+        self.path = pathlib.Path(path)
+        self.sensors = sensors
+        self._names = []  # header names
+        self._index = []  # sensor index -> record sensor field
+        if self.path.exists() and self.path.stat().st_size > 0:
+            with self.path.open("rb") as f:
+                self._names = _read_header(f)["sensors"]
+            size = self.path.stat().st_size
+            # drop a partial last record
+            self._f = self.path.open("r+b", buffering=buffering)
+            self._f.truncate(size - (size - HEADER_SIZE) % RECORD_DTYPE.itemsize)
+            self._f.seek(0, os.SEEK_END)
+            self._map_sensors()
+        else:
+            self._f = self.path.open("w+b", buffering=buffering)
+            self._map_sensors()
+            self._write_header()
+        self._pack = _RECORD.pack
+
+    def _map_sensors(self):
+        """map new sensor indices to header names, rewrite the header if names are added"""
+        added = False
+        for name in self.sensors[len(self._index):]:
+            try:
+                i = self._names.index(name)
+            except ValueError:
+                i = len(self._names)
+                self._names.append(name)
+                added = True
+            self._index.append(i)
+        if added and self._f.tell() > 0:
+            self._write_header()
+
+    def _write_header(self):
+        meta = json.dumps({"version": VERSION, "sensors": self._names, "record_size": RECORD_DTYPE.itemsize})
+        head = MAGIC + meta.encode()
+        if len(head) > HEADER_SIZE:
+            raise AxleJournalException("Too many sensor names for the journal header.")
+        self._f.seek(0)
+        self._f.write(head.ljust(HEADER_SIZE, b" "))
+        self._f.seek(0, os.SEEK_END)
+        self.sync()
+
+    def append(self, timestamp, sensor, ax_number, event):
+        """Add an :class:`pyLRM.axle_sensor.AxleEvent` of axle sensor index sensor received at timestamp."""
+        if sensor >= len(self._index):
+            self._map_sensors()
+        on = event.wheel_on_counter
+        self._f.write(self._pack((timestamp - _EPOCH) // _US * 1000, ax_number, event.wheel_off_counter,
+                                 -1 if on is None else on, self._index[sensor], event.header))
+
+    def sync(self):
+        self._f.flush()
+        os.fsync(self._f.fileno())
+
+    def close(self):
+        if not self._f.closed:
+            self.sync()
+            self._f.close()
+
+
+def read_journal(path):
+    """Memory map an axle journal.
+
+    Returns
+    -------
+    records : numpy.memmap
+        structured array with RECORD_DTYPE fields
+    sensors : list
+        axle sensor names, index is the record sensor field
+    """
+    path = pathlib.Path(path)
+    with path.open("rb") as f:
+        meta = _read_header(f)
+    n = (path.stat().st_size - HEADER_SIZE) // RECORD_DTYPE.itemsize
+    if n == 0:
+        return np.zeros(0, dtype=RECORD_DTYPE), meta["sensors"]
+    return np.memmap(path.as_posix(), dtype=RECORD_DTYPE, mode="r", offset=HEADER_SIZE, shape=(n,)), meta["sensors"]
+
+
+def journal_to_dataframe(path):
+    """Axle journal as pandas.DataFrame indexed by timestamp, times in seconds as in the axle log."""
+    import pandas as pd
+    from pyLRM.axle_sensor import MsgHeader, AXLE_SENSOR_COUNTER_SAMPLE_RATE
+    records, sensors = read_journal(path)
+    wheel_on = records["wheel_on"].astype(np.float64)
+    wheel_on[records["wheel_on"] < 0] = np.nan
+    return pd.DataFrame({"from_axle_sensor": pd.Categorical.from_codes(records["sensor"].astype(np.int16), sensors),
+                         "ax_number": records["ax_number"],
+                         "time_wheel_off": records["wheel_off"] / AXLE_SENSOR_COUNTER_SAMPLE_RATE,
+                         "time_wheel_on": wheel_on / AXLE_SENSOR_COUNTER_SAMPLE_RATE,
+                         "header": [MsgHeader(h).label for h in records["header"]]},
+                        index=pd.DatetimeIndex(records["timestamp"].astype("datetime64[ns]"), name="timestamp"))
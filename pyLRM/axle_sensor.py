@@ -1,8 +1,14 @@
 import time
+import threading
+import json
+from pyLRM.clock import system_clock
+from concurrent.futures import ThreadPoolExecutor
 from digi.xbee.devices import TimeoutException, IOMode
 from digi.xbee.io import IOLine,IOValue
 import struct
 import math
+from enum import IntEnum
+from collections import namedtuple
 # ==========================================================================================
 # MSG PROTOCOL
 # ============
@@ -79,72 +85,257 @@ def frame_stuffing(unstuffed):
     stuffed.append(FRAME_STOP)
     return stuffed
 
-def unstuff_frame_from_serial_data():
-    # https:# eli.thegreenplace.net/2009/08/12/framing-in-serial-communications/
-    unstuffed_frames=[]
-    _partial_frame=None
-    esc=None
-    while True:
-        new_bytes = yield unstuffed_frames
-        unstuffed_frames=[]
-        for b in bytearray(new_bytes):
+class FrameDecoder(object):
+    """Unstuff frames from serial data received by xbee.
+
+    Partial frame and escape state is kept separately for every source (e.g. the 64 bit address of the remote
+    xbee) so interleaved packets from different axle sensors can not corrupt each other.
+    Data between special bytes is copied in slices, only escaped bytes are handled one by one.
+
+    Attributes
+    ----------
+    dropped_frames : int
+        number of frame tails dropped because FRAME_STOP was received without a FRAME_START
+    partial_frames : int
+        number of incomplete frames discarded because a new FRAME_START was received before FRAME_STOP
+    """
+    _START = bytes([FRAME_START])
+    _STOP = bytes([FRAME_STOP])
+    _ESC = bytes([FRAME_ESC])
+
+    def __init__(self):
+        self._state = {}  # source -> (partial_frame or None, esc)
+        self.dropped_frames = 0
+        self.partial_frames = 0
+
+    def reset(self, source=None):
+        """Forget partial frame state of source. If source is None forget state of all sources."""
+        if source is None:
+            self._state.clear()
+        else:
+            self._state.pop(source, None)
+
+    def _next_special(self, data, i):
+        # index of next FRAME_START, FRAME_STOP or FRAME_ESC byte from i, len(data) if none
+        n = len(data)
+        j = n
+        for b in (self._START, self._STOP, self._ESC):
+            k = data.find(b, i, j)
+            if k >= 0:
+                j = k
+        return j
+
+    def decode(self, new_bytes, source=None):
+        """Return list of complete unstuffed frames (bytearray) found in new_bytes.
+
+        Parameters
+        ----------
+        new_bytes : bytes-like
+            received serial data
+        source : hashable
+            key of the sender. Use the raw 64 bit address bytes for data from remote xbee.
+        """
+        # https:# eli.thegreenplace.net/2009/08/12/framing-in-serial-communications/
+        data = bytes(new_bytes)
+        mv = memoryview(data)
+        n = len(data)
+        partial, esc = self._state.get(source, (None, False))
+        frames = []
+        i = 0
+        while i < n:
             if esc:
                 esc = False
-                if isinstance(_partial_frame, bytearray):
-                    _partial_frame.append(b)
-            elif b == FRAME_ESC:
+                if partial is not None:
+                    partial.append(data[i])
+                i += 1
+                continue
+            j = self._next_special(data, i)
+            if partial is not None and j > i:
+                partial += mv[i:j]
+            if j == n:
+                break
+            b = data[j]
+            if b == FRAME_ESC:
                 esc = True
             elif b == FRAME_START:
-                _partial_frame = bytearray()
-            elif b == FRAME_STOP:
-                if isinstance(_partial_frame, bytearray):
-                    unstuffed_frames.append(_partial_frame)
-                _partial_frame = None
-            else:
-                if isinstance(_partial_frame, bytearray):
-                    _partial_frame.append(b)
+                if partial is not None:
+                    self.partial_frames += 1
+                partial = bytearray()
+            else:  # FRAME_STOP
+                if partial is not None:
+                    frames.append(partial)
+                else:
+                    self.dropped_frames += 1
+                partial = None
+            i = j + 1
+        self._state[source] = (partial, esc)
+        return frames
+
+
+def unstuff_frame_from_serial_data():
+    """Generator version of :class:`FrameDecoder` for a single source."""
+    decoder = FrameDecoder()
+    unstuffed_frames = []
+    while True:
+        new_bytes = yield unstuffed_frames
+        unstuffed_frames = decoder.decode(new_bytes)
 
 # AXLE_SENSOR_COUNTER_SAMPLE_RATE ist von der MSP432 clock abhängig. Die ISR lauft auf 1/16 of ACLK (32MHz).
 # der counter incrementiert jede 4 ISR cycles
 AXLE_SENSOR_COUNTER_SAMPLE_RATE= 2000./ 4
+class MsgHeader(IntEnum):
+    """Header byte of the messages from axle_sensor."""
+    AXLE = MSG_HEADER_AXLE
+    AXLE_ERROR = MSG_HEADER_AXLE_ERROR
+    SETUP_OK = MSG_HEADER_SETUP_OK
+    SETUP_ERR = MSG_HEADER_SETUP_ERROR
+    T_ON = MSG_HEADER_T_ON
+    T_OFF = MSG_HEADER_T_OFF
+    T_ERR = MSG_HEADER_T_ERR
+    SUM_LEN = MSG_HEADER_SUM_LEN
+    PING = MSG_HEADER_ECHO
+
+    @property
+    def label(self):
+        """Header name as used in logs and passby files, e.g. 'MSG_HEADER_AXLE'."""
+        return "MSG_HEADER_" + self.name
+
+
+class AxleEvent(namedtuple('AxleEvent', ['header', 'wheel_on_counter', 'wheel_off_counter'])):
+    """Axle message (MSG_HEADER_AXLE or MSG_HEADER_AXLE_ERROR).
+
+    Counters are the raw axle_sensor counter values, wheel_on_counter is None for error messages.
+    """
+    __slots__ = ()
+
+    @property
+    def is_error(self):
+        return self.header is MsgHeader.AXLE_ERROR
+
+    @property
+    def time_wheel_on(self):
+        if self.wheel_on_counter is None:
+            return None
+        return self.wheel_on_counter / AXLE_SENSOR_COUNTER_SAMPLE_RATE
+
+    @property
+    def time_wheel_off(self):
+        return self.wheel_off_counter / AXLE_SENSOR_COUNTER_SAMPLE_RATE
+
+    def to_dict(self):
+        return {'header': self.header.label,
+                'time_wheel_on': self.time_wheel_on,
+                'time_wheel_off': self.time_wheel_off}
+
+
+class SetupMsg(namedtuple('SetupMsg', ['header', 'value'])):
+    """Setup response message (msg_out_setup), value is the second byte of the response."""
+    __slots__ = ()
+    _DICT_KEYS = {MsgHeader.SETUP_OK: 'msg_in',
+                  MsgHeader.SETUP_ERR: 'msg_in',
+                  MsgHeader.T_ON: 'thresholdON',
+                  MsgHeader.T_OFF: 'thresholdOFF',
+                  MsgHeader.T_ERR: 'thresholdERR',
+                  MsgHeader.SUM_LEN: 'sum_len',
+                  MsgHeader.PING: 'echo'}
+
+    def to_dict(self):
+        return {'header': self.header.label, self._DICT_KEYS[self.header]: self.value}
+
+
+_AXLE_STRUCT = struct.Struct('<BI')  # little endian unsigned Byte unsigned Int
+_AXLE_ERROR_STRUCT = struct.Struct('<I')
+_SETUP_STRUCT = struct.Struct('<B')
+
+
+def _parse_axle(frame):
+    on, off = _AXLE_STRUCT.unpack(frame[1:])
+    return AxleEvent(MsgHeader.AXLE, on, off)
+
+
+def _parse_axle_error(frame):
+    off, = _AXLE_ERROR_STRUCT.unpack_from(frame, 1)
+    return AxleEvent(MsgHeader.AXLE_ERROR, None, off)
+
+
+def _setup_parser(header, offset=0):
+    def _parse_setup(frame):
+        v, = _SETUP_STRUCT.unpack_from(frame, 1)
+        return SetupMsg(header, v - offset)
+    return _parse_setup
+
+
+# header indexed dispatch table
+_MSG_PARSERS = [None] * 256
+_MSG_PARSERS[MSG_HEADER_AXLE] = _parse_axle
+_MSG_PARSERS[MSG_HEADER_AXLE_ERROR] = _parse_axle_error
+for _h in (MsgHeader.SETUP_OK, MsgHeader.SETUP_ERR, MsgHeader.T_ON, MsgHeader.T_OFF, MsgHeader.T_ERR,
+           MsgHeader.SUM_LEN):
+    _MSG_PARSERS[_h] = _setup_parser(_h)
+_MSG_PARSERS[MSG_HEADER_ECHO] = _setup_parser(MsgHeader.PING, offset=MSG_ECHO)
+
+
 def parse_msg(frame):
-    header=frame[0]
-    raw_data= frame[1:]
-    d={}
-    #
-    if header==MSG_HEADER_AXLE:
-        on,off =struct.unpack('<BI',raw_data) #little endian unsigned Byte unsigned Int
-        d['header'] = "MSG_HEADER_AXLE"
-        d['time_wheel_on'] = on / AXLE_SENSOR_COUNTER_SAMPLE_RATE
-        d['time_wheel_off'] = off / AXLE_SENSOR_COUNTER_SAMPLE_RATE
-    elif header==MSG_HEADER_AXLE_ERROR:
-        d['header'] = "MSG_HEADER_AXLE_ERROR"
-        d['time_wheel_on'] = None
-        d['time_wheel_off'] = int.from_bytes(raw_data[0:4],'little') / AXLE_SENSOR_COUNTER_SAMPLE_RATE
-    elif header == MSG_HEADER_SETUP_OK:
-        d['header'] = "MSG_HEADER_SETUP_OK"
-        d['msg_in'] = raw_data[0]
-    elif header == MSG_HEADER_SETUP_ERROR:
-        d['header'] = "MSG_HEADER_SETUP_ERR"
-        d['msg_in'] = raw_data[0]
-    elif header == MSG_HEADER_SUM_LEN:
-        d['header'] = "MSG_HEADER_SUM_LEN"
-        d['sum_len'] = raw_data[0]
-    elif header == MSG_HEADER_T_ERR:
-        d['header'] = "MSG_HEADER_T_ERR"
-        d['thresholdERR'] = raw_data[0]
-    elif header == MSG_HEADER_T_OFF:
-        d['header'] = "MSG_HEADER_T_OFF"
-        d['thresholdOFF'] = raw_data[0]
-    elif header == MSG_HEADER_T_ON:
-        d['header'] = "MSG_HEADER_T_ON"
-        d['thresholdON'] = raw_data[0]
-    elif header == MSG_HEADER_ECHO:
-        d['header'] = "MSG_HEADER_PING"
-        d['echo'] = raw_data[0]-MSG_ECHO
-    else:
-        raise AxleSensorException("Message header {} is unvalid.".format(header))
-    return d
+    """Parse an unstuffed frame. Return :class:`AxleEvent` or :class:`SetupMsg`."""
+    f = _MSG_PARSERS[frame[0]]
+    if f is None:
+        raise AxleSensorException("Message header {} is unvalid.".format(frame[0]))
+    return f(frame)
+
+
+def parse_frames(frames, on_error=None):
+    """Parse all frames of a xbee payload.
+
+    If on_error is None an invalid frame raise an exception, else on_error(frame, exception) is called and the
+    frame is skipped.
+    """
+    parsers = _MSG_PARSERS
+    msgs = []
+    for frame in frames:
+        try:
+            f = parsers[frame[0]]
+            if f is None:
+                raise AxleSensorException("Message header {} is unvalid.".format(frame[0]))
+            msgs.append(f(frame))
+        except (AxleSensorException, struct.error, IndexError) as e:
+            if on_error is None:
+                raise
+            on_error(frame, e)
+    return msgs
+
+
+class _SyncOpsTimeout(object):
+    """Set the sync ops timeout of the coordinator xbee while at least one request uses it.
+
+    The timeout is a setting of the shared coordinator. The requests of several sensors run concurrently
+    (responses are read per remote address), so the coordinator uses the largest timeout of all active requests
+    and returns to default when the last one exits. A request never gets less time than it asked for.
+    """
+    _lock = threading.Lock()
+    _users = {}
+
+    def __init__(self, local_xbee, timeout, default=1):
+        self._xbee = local_xbee
+        self._timeout = timeout
+        self._default = default
+
+    def _apply(self, timeouts):
+        self._xbee.set_sync_ops_timeout(max(timeouts) if timeouts else self._default)
+
+    def __enter__(self):
+        with self._lock:
+            timeouts = self._users.setdefault(id(self._xbee), [])
+            timeouts.append(self._timeout)
+            self._apply(timeouts)
+        return self
+
+    def __exit__(self, *exc):
+        with self._lock:
+            timeouts = self._users[id(self._xbee)]
+            timeouts.remove(self._timeout)
+            if not timeouts:
+                del self._users[id(self._xbee)]
+            self._apply(timeouts)
 
 
 class AxleSensor(object):
@@ -168,6 +359,16 @@ class AxleSensor(object):
         self._logger=logger.getChild(self.__class__.__name__)
         #self._rx_queque = queue.Queue()
         self.name=name
+        # cached state: address and str never change, settings as last set or read (cleared by reset)
+        self._addr = self._xbee.get_64bit_addr()
+        self._str = "Axle Sensor {}, MAC:{}".format(self.name, self._addr)
+        self._settings = {}
+        self._mode = None
+        self._echo = None
+        self._vbat_adc = None
+        self._vbat_time = None
+        self._last_seen = None
+        self._reset_time = None
         if setup_io:
             self._xbee.set_io_configuration(self.VBAT_PIN, IOMode.ADC)
             self._xbee.set_io_configuration(self.RESET_PIN, IOMode.DIGITAL_OUT_HIGH)
@@ -180,47 +381,70 @@ class AxleSensor(object):
         """ all axle sensor have to be set in idle!
             send 1 byte and wait for 2 byte response
         """
-        f_gen = unstuff_frame_from_serial_data()
-        f_gen.send(None)
-        self._local_xbee.set_sync_ops_timeout(0.5)
+        decoder = FrameDecoder()
+        with _SyncOpsTimeout(self._local_xbee, 0.5):
+            try:
+                self._local_xbee.send_data(self._xbee, bytearray([msg_byte]))
+            except TimeoutException:
+                s = '{} is not reachable'.format(self)
+                self._logger.error(s)
+                raise AxleSensorException(s)
+        #wait for 2 byte response
         try:
-            self._local_xbee.send_data(self._xbee, bytearray([msg_byte]))
+            xbee_msg=self._local_xbee.read_data_from(self._xbee, 0.3)
         except TimeoutException:
-            s = '{} is not reachable'.format(self)
+            s = '{} is not responding.'.format(self)
             self._logger.error(s)
             raise AxleSensorException(s)
         else:
-            #wait for 2 byte response
-            try:
-                xbee_msg=self._local_xbee.read_data_from(self._xbee, 0.3)
-            except TimeoutException:
-                s = '{} is not responding.'.format(self)
-                self._logger.error(s)
-                raise AxleSensorException(s)
-            else:
-                self._logger.debug("Recieved msg {}".format(xbee_msg.data))
-                frames=f_gen.send(xbee_msg.data)
-                if len(frames)>1:
-                    raise AxleSensorException("Too many response: {}".format(frames))
-                return parse_msg(frames[0])
-        finally:
-            self._local_xbee.set_sync_ops_timeout(1)
+            self._logger.debug("Recieved msg {}".format(xbee_msg.data))
+            frames=decoder.decode(xbee_msg.data)
+            if len(frames)>1:
+                raise AxleSensorException("Too many response: {}".format(frames))
+            self._last_seen = system_clock.now()
+            return parse_msg(frames[0])
 
 
     def __str__(self):
-        return "Axle Sensor {}, MAC:{}".format(self.name,self.get_64bit_addr())
+        return self._str
 
     def __repr__(self):
-        return self.__str__()
+        return self._str
 
     def get_64bit_addr(self):
-        return self._xbee.get_64bit_addr()
+        return self._addr
+
+    @property
+    def last_seen(self):
+        """Time of the last response or message of the sensor (see :meth:`mark_seen`)."""
+        return self._last_seen
+
+    def mark_seen(self, timestamp=None):
+        """Record that a message of the sensor was received (e.g. an axle message)."""
+        self._last_seen = system_clock.now() if timestamp is None else timestamp
+
+    def snapshot(self):
+        """Cached state as json serialisable dict, no radio traffic."""
+        vbat_raw = None if self._vbat_adc is None else self._vbat_adc * (1.2 / 1024)
+        return {"name": self.name,
+                "address": str(self._addr),
+                "mode": self._mode,
+                "settings": dict(self._settings),
+                "vbat": None if vbat_raw is None else vbat_raw * self.VBAT_SCALING,
+                "vbat_raw": vbat_raw,
+                "echo": self._echo,
+                "last_seen": None if self._last_seen is None else self._last_seen.isoformat(),
+                "reset_time": None if self._reset_time is None else self._reset_time.isoformat()}
 
     def reset(self):
         self._logger.info('Reset {}.'.format(self))
         self._xbee.set_dio_value(self.RESET_PIN, IOValue.LOW)
         time.sleep(1)
         self._xbee.set_dio_value(self.RESET_PIN, IOValue.HIGH)
+        self._settings.clear()
+        self._echo = None
+        self._mode = None
+        self._reset_time = system_clock.now()
         self.set_idle()
 
     def set_idle(self):
@@ -228,131 +452,370 @@ class AxleSensor(object):
         self._xbee.set_dio_value(self.IDLE_PIN_P4_0, IOValue.LOW)
         time.sleep(0.1)
         self._xbee.set_dio_value(self.SHUTDOWN_CELL_PIN, IOValue.LOW)
+        self._mode = "idle"
 
     def set_rdy(self):
         self._logger.info('Set rdy {}.'.format(self))
         self._xbee.set_dio_value(self.IDLE_PIN_P4_0, IOValue.HIGH)
         time.sleep(0.1)
         self._xbee.set_dio_value(self.SHUTDOWN_CELL_PIN, IOValue.HIGH)
+        self._mode = "rdy"
 
     def echo(self, i=0):
         if i not in range(8):
             raise ValueError("Echo value has to be  in {}.".format(range(8)))
-        return self._send_rcv_status(MSG_ECHO+i)['echo']
+        self._echo = self._send_rcv_status(MSG_ECHO+i).value
+        return self._echo
 
-    def get_vbat(self, raw=False):
+    def get_vbat(self, raw=False, max_age=None):
+        """Battery voltage, raw: voltage at the ADC pin.
+
+        If max_age (seconds) is given a cached reading younger than max_age is returned without radio traffic.
+        """
+        if max_age is None or self._vbat_time is None or time.monotonic() - self._vbat_time > max_age:
+            self._vbat_adc = self._xbee.get_adc_value(self.VBAT_PIN)
+            self._vbat_time = time.monotonic()
         if raw:
-            return self._xbee.get_adc_value(self.VBAT_PIN)* (1.2 / 1024)
+            return self._vbat_adc * (1.2 / 1024)
         else:
-            return self._xbee.get_adc_value(self.VBAT_PIN) * (1.2 / 1024) * self.VBAT_SCALING
+            return self._vbat_adc * (1.2 / 1024) * self.VBAT_SCALING
 
     #msp432 settings
-    def get_threshold_ERR(self):
-        return self._send_rcv_status(MSG_GET_T_ERR)['thresholdERR']
+    # get_* return the cached value (as last set or read) unless refresh is True
+    def _get_setting(self, name, msg_byte, refresh):
+        if not refresh and name in self._settings:
+            return self._settings[name]
+        value = self._send_rcv_status(msg_byte).value
+        self._settings[name] = value
+        return value
+
+    def _set_setting(self, name, value):
+        msg = self._send_rcv_status(self._setting_msg(name, value))
+        if msg.header == MsgHeader.SETUP_OK:
+            self._settings[name] = value
+        else:
+            self._settings.pop(name, None)
+        return msg.header.label
+
+    def get_threshold_ERR(self, refresh=False):
+        return self._get_setting('thresholdERR', MSG_GET_T_ERR, refresh)
 
-    def get_threshold_ON(self):
-        return self._send_rcv_status(MSG_GET_T_ON)['thresholdON']
+    def get_threshold_ON(self, refresh=False):
+        return self._get_setting('thresholdON', MSG_GET_T_ON, refresh)
 
-    def get_threshold_OFF(self):
-        return self._send_rcv_status(MSG_GET_T_OFF)['thresholdOFF']
+    def get_threshold_OFF(self, refresh=False):
+        return self._get_setting('thresholdOFF', MSG_GET_T_OFF, refresh)
 
-    def get_sum_len(self):
-        return self._send_rcv_status(MSG_GET_SUM_LEN)['sum_len']
+    def get_sum_len(self, refresh=False):
+        return self._get_setting('sum_len', MSG_GET_SUM_LEN, refresh)
 
     def set_threshold_ERR(self, seconds=None):
         if seconds is None:
             seconds= self.DEFAULT_THRESHOLD_ERR
-        elif int(seconds)>5:
-            raise ValueError("seconds has to be < 5.")
-        return self._send_rcv_status(MSG_SET_T_ERR+int(seconds))['header']
+        return self._set_setting('thresholdERR', seconds)
 
     def set_threshold_ON(self, count=None):
         if count is None:
             count= self.DEFAULT_THRESHOLD_ON
-        elif int(count)>16 or int(count)<0:
-            raise ValueError("Threshold depend on sum_len. But has to be 0<threshold<16 anyway.")
-        return self._send_rcv_status(MSG_SET_T_ON+int(count))['header']
+        return self._set_setting('thresholdON', count)
 
     def set_threshold_OFF(self, count=None):
         if count is None:
             count= self.DEFAULT_THRESHOLD_OFF
-        elif int(count)>16 or int(count)<0:
-            raise ValueError("Threshold depend on sum_len. But has to be 0<threshold<16 anyway.")
-        return self._send_rcv_status(MSG_SET_T_OFF+int(count))['header']
+        return self._set_setting('thresholdOFF', count)
 
     def set_sum_len(self, len):
         if len is None:
             len = self.DEFAULT_SUM_LEN
-        elif len not in self.VALID_SUM_LEN:
-            raise ValueError("seconds has to be  in {}".format(str(self.VALID_SUM_LEN)))
-        return self._send_rcv_status(MSG_SET_SUM_LEN + int(math.log2(len)))['header']
-
-
-def init_axle_sensors_network(found_xbee, expected_axle_sensors,logger):
-    xbee_addr = [d.get_64bit_addr() for d in found_xbee]
+        return self._set_setting('sum_len', len)
+
+    # settings of apply_settings, each set msg_in byte is one transmission (the firmware has a one byte RX buffer)
+    # name, get msg, response header of get msg. Order in which settings are applied (thresholds depend on sum_len)
+    SETTINGS = [('sum_len', MSG_GET_SUM_LEN, MsgHeader.SUM_LEN),
+                ('thresholdOFF', MSG_GET_T_OFF, MsgHeader.T_OFF),
+                ('thresholdON', MSG_GET_T_ON, MsgHeader.T_ON),
+                ('thresholdERR', MSG_GET_T_ERR, MsgHeader.T_ERR)]
+
+    @staticmethod
+    def _setting_msg(name, value):
+        """msg_in byte setting name to value"""
+        if name == 'sum_len':
+            if value not in AxleSensor.VALID_SUM_LEN:
+                raise ValueError("seconds has to be  in {}".format(str(AxleSensor.VALID_SUM_LEN)))
+            return MSG_SET_SUM_LEN + int(math.log2(value))
+        elif name == 'thresholdERR':
+            if int(value)>5:
+                raise ValueError("seconds has to be < 5.")
+            return MSG_SET_T_ERR + int(value)
+        elif name in ('thresholdON', 'thresholdOFF'):
+            if int(value)>16 or int(value)<0:
+                raise ValueError("Threshold depend on sum_len. But has to be 0<threshold<16 anyway.")
+            return (MSG_SET_T_ON if name == 'thresholdON' else MSG_SET_T_OFF) + int(value)
+        raise ValueError("Unknown setting {}.".format(name))
+
+    @staticmethod
+    def _setting_of_msg(msg_in):
+        """setting name of a set msg_in byte (value of the MSG_HEADER_SETUP_OK/ERROR response)"""
+        if MSG_SET_SUM_LEN <= msg_in < MSG_SET_T_ON:
+            return 'sum_len'
+        elif MSG_SET_T_ON <= msg_in < MSG_SET_T_OFF:
+            return 'thresholdON'
+        elif MSG_SET_T_OFF <= msg_in < MSG_SET_T_ERR:
+            return 'thresholdOFF'
+        return 'thresholdERR'
+
+    @classmethod
+    def _is_response(cls, msg_byte, msg):
+        """True if msg is the response of msg_in byte msg_byte"""
+        if msg.header in (MsgHeader.SETUP_OK, MsgHeader.SETUP_ERR):
+            return msg.value == msg_byte
+        return any(get_msg == msg_byte and header == msg.header for _, get_msg, header in cls.SETTINGS)
+
+    def _send_rcv_sequence(self, msg_bytes, timeout):
+        """send msg bytes one per transmission, each after the response of the previous one.
+
+        The firmware reads msg_in one byte at a time with a one byte RX buffer, bytes arriving while it sends a
+        response are lost. Responses not matching the byte sent (late responses of an earlier request) are
+        skipped. timeout is the time to wait for each response.
+        """
+        decoder = FrameDecoder()
+        msgs = []
+        with _SyncOpsTimeout(self._local_xbee, 0.5):
+            for msg_byte in msg_bytes:
+                try:
+                    self._local_xbee.send_data(self._xbee, bytearray([msg_byte]))
+                except TimeoutException:
+                    s = '{} is not reachable'.format(self)
+                    self._logger.error(s)
+                    raise AxleSensorException(s)
+                deadline = time.monotonic() + timeout
+                response = None
+                while response is None:
+                    remaining = deadline - time.monotonic()
+                    try:
+                        if remaining <= 0:
+                            raise TimeoutException()
+                        xbee_msg = self._local_xbee.read_data_from(self._xbee, remaining)
+                    except TimeoutException:
+                        s = '{} is not responding. Received {} of {} responses.'.format(self, len(msgs),
+                                                                                        len(msg_bytes))
+                        self._logger.error(s)
+                        raise AxleSensorException(s)
+                    self._logger.debug("Recieved msg {}".format(xbee_msg.data))
+                    self._last_seen = system_clock.now()
+                    for msg in parse_frames(decoder.decode(xbee_msg.data)):
+                        if response is None and self._is_response(msg_byte, msg):
+                            response = msg
+                        else:
+                            self._logger.debug("Skip response {} to msg_in {}.".format(msg, msg_byte))
+                msgs.append(response)
+        return msgs
+
+    def apply_settings(self, sum_len=None, thresholdON=None, thresholdOFF=None, thresholdERR=None, verify=True,
+                       timeout=0.5):
+        """Set several settings, one transmission per msg_in byte.
+
+        The firmware reads msg_in with a one byte RX buffer, so the set messages can not be batched in one
+        transmission: each byte is sent after the response of the previous one (see :meth:`_send_rcv_sequence`).
+        Every set message is confirmed by the MSG_HEADER_SETUP_OK echo of its msg_in byte, which encodes the value.
+        With verify the get messages are sent afterwards to read the values back (one more round trip per
+        setting). Settings that are None or already have the value (as last set or read, cleared by reset) are
+        not sent.
+
+        Returns
+        -------
+        dict
+            setting name -> value read back (verify) or set value confirmed by the echo
+
+        Raises
+        ------
+        AxleSensorException
+            if a setting is refused, a response is missing or a read back value differs
+        """
+        values = {'sum_len': sum_len, 'thresholdON': thresholdON, 'thresholdOFF': thresholdOFF,
+                  'thresholdERR': thresholdERR}
+        changes = [(name, values[name], get_msg, header) for name, get_msg, header in self.SETTINGS
+                   if values[name] is not None and self._settings.get(name) != values[name]]
+        unchanged = {name: self._settings[name] for name, _, _ in self.SETTINGS
+                     if values[name] is not None and self._settings.get(name) == values[name]}
+        if not changes:
+            return unchanged
+        msg_bytes = [self._setting_msg(name, value) for name, value, _, _ in changes]
+        if verify:
+            msg_bytes += [get_msg for _, _, get_msg, _ in changes]
+        for name, _, _, _ in changes:
+            self._settings.pop(name, None)
+        result = {}
+        for msg in self._send_rcv_sequence(msg_bytes, timeout):
+            if msg.header == MsgHeader.SETUP_ERR:
+                raise AxleSensorException("{} refused {}.".format(self, self._setting_of_msg(msg.value)))
+            elif msg.header != MsgHeader.SETUP_OK:
+                result.update((name, msg.value) for name, _, header in self.SETTINGS if header == msg.header)
+        if not verify:
+            result = {name: value for name, value, _, _ in changes}
+        for name, value, _, _ in changes:
+            if result.get(name) != value:
+                raise AxleSensorException("{}, {} is {} instead of {}.".format(self, name, result.get(name), value))
+        self._settings.update(result)
+        result.update(unchanged)
+        return result
+
+
+class AxleSensorRegistry(object):
+    """Axle sensor names and integer indices by raw 64-bit xbee address.
+
+    The index is the position of the sensor in names. It is used in place of address or name in the receive
+    path, the axle log counters and the axle journal. Sensors can be added at runtime (e.g. found late by the
+    network discovery), indices of registered sensors never change.
+
+    Parameters
+    ----------
+    sensors : dict
+        name -> address (XBee64BitAddress, bytes or int), e.g. config.xbee_axle_sensors
+    """
+
+    def __init__(self, sensors=None):
+        self.names = []
+        self.addresses = []
+        self._by_key = {}
+        self._lock = threading.Lock()
+        for name, addr in (sensors or {}).items():
+            self.add(name, addr)
+
+    @staticmethod
+    def key(addr):
+        """raw address bytes of XBee64BitAddress, bytes, bytearray or int"""
+        if isinstance(addr, bytes):
+            return addr
+        if isinstance(addr, int):
+            return addr.to_bytes(8, 'big')
+        if isinstance(addr, bytearray):
+            return bytes(addr)
+        return bytes(addr.address)
+
+    def add(self, name, addr):
+        """Register a sensor, return its index. The index of an already registered address is returned."""
+        key = self.key(addr)
+        with self._lock:
+            index = self._by_key.get(key)
+            if index is None:
+                if name in self.names:
+                    raise ValueError("Axle sensor {} already registered with another address.".format(name))
+                index = len(self.names)
+                self.names.append(name)
+                self.addresses.append(addr)
+                self._by_key[key] = index
+            return index
+
+    def index(self, addr):
+        """index of the sensor with address addr, None if unknown"""
+        return self._by_key.get(self.key(addr))
+
+    def index_of_key(self, key):
+        """index of the sensor with raw address bytes key, None if unknown (receive path)"""
+        return self._by_key.get(key)
+
+    def name(self, addr):
+        """name of the sensor with address addr, None if unknown"""
+        index = self._by_key.get(self.key(addr))
+        return None if index is None else self.names[index]
+
+    def __len__(self):
+        return len(self.names)
+
+    def __contains__(self, addr):
+        return self.key(addr) in self._by_key
+
+
+def init_axle_sensors_network(found_xbee, expected_axle_sensors,logger, registry=None):
+    """Return an :class:`AxleSensor` for every expected sensor found by the network discovery.
+
+    expected_axle_sensors is a dict name -> address or an :class:`AxleSensorRegistry`. Found sensors are added
+    to registry if given.
+    """
+    found = {AxleSensorRegistry.key(d.get_64bit_addr()): d for d in found_xbee}
+    if isinstance(expected_axle_sensors, AxleSensorRegistry):
+        expected_axle_sensors = dict(zip(expected_axle_sensors.names, expected_axle_sensors.addresses))
     ##
     axle_sensors=[]
     for name,addr in expected_axle_sensors.items():
-        try:
-            index = xbee_addr.index(addr)
-        except ValueError:
+        device = found.get(AxleSensorRegistry.key(addr))
+        if device is None:
             logger.warning('Axle Sensor {}, MAC: {} is missing.'.format(name,str(addr)))
         else:
-            ax=AxleSensor(remote_axle_sensor_xbee=found_xbee[index],name=name,logger=logger)
+            ax=AxleSensor(remote_axle_sensor_xbee=device,name=name,logger=logger)
             axle_sensors.append(ax)
+            if registry is not None:
+                registry.add(name, addr)
             logger.info('{} found.'.format(ax))
 
     return axle_sensors
 
 
-def setup_axle_sensors(axle_sensors, logger, sum_len=None,thresholdOFF=None,thresholdON=None,thresholdERR=None):
-    logger.info("===Reset Axle Sensors (put in idle state and reset mcu)")
-    for ax in axle_sensors:
-        ax.reset()
-    if sum_len is not None:
-        logger.info("===Set sum len")
-        for ax in axle_sensors:
-            h = ax.set_sum_len(sum_len)
-            logger.info("{}, set sum_len to {}, return {}.".format(ax, sum_len, h))
-            sum_len = ax.get_sum_len()
-            logger.info("{}, read sum_len as control. sum_len {}.".format(ax, sum_len))
-            assert sum_len == sum_len
-    #
-    if thresholdOFF is not None:
-        logger.info("===Set thresholdOFF")
-        for ax in axle_sensors:
-            h = ax.set_threshold_OFF(thresholdOFF)
-            logger.info("{}, set thresholdOFF to {}, return {}.".format(ax, thresholdOFF, h))
-            t = ax.get_threshold_OFF()
-            logger.info("{}, read thresholdOFF as control. thresholdOFF {}.".format(ax, t))
-            assert t == thresholdOFF
-    #
-    if thresholdON is not None:
-        logger.info("===Set thresholdON")
-        for ax in axle_sensors:
-            h = ax.set_threshold_ON(thresholdON)
-            logger.info("{}, set thresholdON to {}, return {}.".format(ax, thresholdON, h))
-            t = ax.get_threshold_ON()
-            logger.info("{}, read thresholdON as control. thresholdON {}.".format(ax, t))
-            assert t == thresholdON
-
-    if thresholdERR is not None:
-        logger.info("===Set thresholdERR")
-        for ax in axle_sensors:
-            h = ax.set_threshold_ERR(thresholdERR)
-            logger.info("{}, set thresholdERR to {}, return {}.".format(ax, thresholdERR, h))
-            t = ax.get_threshold_ERR()
-            logger.info("{}, read thresholdERR as control. thresholdERR {}.".format(ax, t))
-            assert t == thresholdERR
-
-    logger.info("===Log VBAT")
-    for ax in axle_sensors:
-        v = ax.get_vbat()
-        vr = ax.get_vbat(raw=True)
-        logger.info("{}, vbat {},  vbat raw {}.".format(ax, v, vr))
+class SetupReport(namedtuple('SetupReport', ['name', 'ok', 'settings', 'vbat', 'vbat_raw', 'error'])):
+    """Result of the setup of one axle sensor.
+
+    settings holds the values confirmed by the sensor, error the message of the failed step (None if ok).
+    """
+    __slots__ = ()
+
+
+def _setup_axle_sensor(ax, logger, settings):
+    """Reset and configure one axle sensor. Return :class:`SetupReport`.
+
+    The remote AT calls (reset, vbat) hold the default sync ops timeout, the sensors are set up concurrently and
+    another worker may hold the shorter timeout of apply_settings meanwhile.
+    """
+    read = {}
+    vbat = vbat_raw = None
+    try:
+        with _SyncOpsTimeout(ax._local_xbee, 1):
+            ax.reset()
+        read = ax.apply_settings(verify=False, **settings)
+        logger.info("{}, set {}, confirmed {}.".format(ax, settings, read))
+        with _SyncOpsTimeout(ax._local_xbee, 1):
+            vbat = ax.get_vbat()
+            vbat_raw = ax.get_vbat(raw=True, max_age=1.)
+        logger.info("{}, vbat {},  vbat raw {}.".format(ax, vbat, vbat_raw))
+    except Exception as e:
+        logger.error("{}, setup failed: {}".format(ax, e))
+        return SetupReport(ax.name, False, read, vbat, vbat_raw, str(e))
+    return SetupReport(ax.name, True, read, vbat, vbat_raw, None)
+
+
+def setup_axle_sensors(axle_sensors, logger, sum_len=None,thresholdOFF=None,thresholdON=None,thresholdERR=None,
+                       workers=None):
+    """Reset and configure all axle sensors concurrently, one worker thread per sensor.
+
+    reset clears the cached settings, so every setting is sent: one transmission per msg_in byte (the firmware
+    can not take batched bytes), confirmed by its SETUP_OK echo without read back (see
+    :meth:`AxleSensor.apply_settings`). Sensors configured without errors are put in rdy state.
+
+    Returns
+    -------
+    dict
+        axle sensor name -> :class:`SetupReport`
+    """
+    settings = {'sum_len': sum_len, 'thresholdOFF': thresholdOFF, 'thresholdON': thresholdON,
+                'thresholdERR': thresholdERR}
+    logger.info("===Reset and setup Axle Sensors ({})".format(settings))
+    if not axle_sensors:
+        return {}
+    with ThreadPoolExecutor(max_workers=workers or len(axle_sensors)) as executor:
+        reports = list(executor.map(lambda ax: _setup_axle_sensor(ax, logger, settings), axle_sensors))
 
     logger.info("=================================")
     logger.info("=== Put Axle Sensor in rdy state.")
-    for ax in axle_sensors:
-        ax.set_rdy()
+    for ax, report in zip(axle_sensors, reports):
+        if report.ok:
+            ax.set_rdy()
+        else:
+            logger.error("{} not set in rdy state. Setup error: {}".format(ax, report.error))
+    return {r.name: r for r in reports}
+
 
+def save_axle_sensors_snapshot(axle_sensors, path):
+    """Append the snapshots of all axle sensors as one json line to path (history of a measurement session)."""
+    with path.open("a") as f:
+        f.write(json.dumps({"time": system_clock.now().isoformat(),
+                            "axle_sensors": [ax.snapshot() for ax in axle_sensors]}) + "\n")
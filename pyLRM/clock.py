@@ -0,0 +1,54 @@
+import datetime
+import time
+
+# Clocks used by TrainPassby and the acquisition loop.
+#
+# SystemClock reads time.monotonic() and anchors it to the wall clock once, so intervals (stop_delay) are not
+# affected by NTP steps of the system clock. The anchor is renewed only with resync(), between passbys.
+# SimulatedClock is set explicitly, used by the replay and in tests.
+
+
+class SystemClock(object):
+    """Wall time derived from a monotonic time source."""
+
+    def __init__(self):
+        self.resync()
+
+    def resync(self):
+        """Anchor the monotonic time to the current wall time."""
+        # single assignment, now() may run in the xbee thread
+        self._anchor = (time.monotonic(), datetime.datetime.now())
+
+    def monotonic(self):
+        """Seconds, for intervals only."""
+        return time.monotonic()
+
+    def now(self):
+        mono0, wall0 = self._anchor
+        return wall0 + datetime.timedelta(seconds=time.monotonic() - mono0)
+
+
+class SimulatedClock(object):
+    """Clock that only moves when set or advanced."""
+
+    def __init__(self, t=None):
+        self.t = t
+
+    def resync(self):
+        pass
+
+    def set(self, t):
+        self.t = t
+
+    def advance(self, seconds):
+        self.t += datetime.timedelta(seconds=seconds)
+
+    def monotonic(self):
+        return self.t.timestamp()
+
+    def now(self):
+        return self.t
+
+
+# clock of the measurement process
+system_clock = SystemClock()
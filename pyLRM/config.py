@@ -3,6 +3,7 @@ import datetime
 import yaml
 import pathlib
 from pyLRM.passby import TrainPassby
+from pyLRM.axle_sensor import AxleSensorRegistry
 
 try:
     secret = yaml.load(pathlib.Path().absolute().joinpath('accounts.secret.yaml').open("r+"))
@@ -49,7 +50,8 @@ mail_handler = {"mailhost":('smtp.gmail.com', 465),
 
 class MyTrainPassby(TrainPassby):
     def rec(self):
-        ax1_count, ax2_count=[self._ax_counter[n] for n in self.ax_names]
+        # trigger pair: the first two configured sensors
+        ax1_count, ax2_count=[self._ax_counter[n] for n in self.ax_names[:2]]
         if self._stopped or self.is_error:
             return False
         elif self._start_time is None:
@@ -83,11 +85,12 @@ class MyTrainPassby(TrainPassby):
 ############################
 ############################
 ############################
-_xbee_axle_sensors_inv = { str(addr):name for name,addr in xbee_axle_sensors.items()}
+# name <-> sensor index <-> raw 64 bit address. Sensors found late can be added with axle_sensors_registry.add
+axle_sensors_registry = AxleSensorRegistry(xbee_axle_sensors)
 xbee_axle_sensors_names ={name for name in xbee_axle_sensors.keys()}
 
 def xbee_axle_sensors_name_from_addr(xbeeaddr):
-    return _xbee_axle_sensors_inv.get(str(xbeeaddr),None)
+    return axle_sensors_registry.name(xbeeaddr)
 
 
 
@@ -1,37 +1,105 @@
-from logging.handlers import SMTPHandler
+from logging.handlers import SMTPHandler, QueueHandler, QueueListener, RotatingFileHandler, TimedRotatingFileHandler
 import logging
+import atexit
 import smtplib
+import queue
+import threading
+import time
+from collections import OrderedDict
 from email.utils import formatdate
 import sys
 import pathlib
 import pyLRM.config as config
-import parse,datetime
+from pyLRM.axle_sensor import AxleEvent, MsgHeader
+import datetime
+import re
+import numpy as np
 
 FORMATTER = logging.Formatter('%(asctime)s | %(name)s |  %(levelname)s: %(message)s')
 FORMATTER2 = logging.Formatter('%(name)s |  %(levelname)s: %(message)s')
 
-def init_logger(name="", level = "INFO", filepath=pathlib.Path(), systdout=True, file=True):
+class DeferredQueueHandler(QueueHandler):
+    """QueueHandler that leaves formatting to the listener thread.
+
+    QueueHandler.prepare formats the message on the logging thread. The records stay in this process, so they
+    are queued as they are and the listener handlers format them. Log arguments must not be modified after the
+    logging call.
+    """
+
+    def prepare(self, record):
+        return record
+
+
+# running QueueListener by logger name
+_listeners = {}
+
+
+def init_logger(name="", level = "INFO", filepath=pathlib.Path(), systdout=True, file=True, use_queue=True,
+                max_bytes=0, backup_count=0, when=None):
+    """Logger LRM_<name> writing to LRM_<name>.log in filepath and stdout.
+
+    With use_queue the logger has only a :class:`DeferredQueueHandler`. A single QueueListener thread formats
+    the records and does the file and stdout I/O, so logging calls do not wait on the SD card.
+
+    The log file is rotated at max_bytes (RotatingFileHandler, 0: never) or, if when is given, by time
+    (TimedRotatingFileHandler, e.g. when='midnight'). backup_count rotated files are kept (0: all for size
+    rotation).
+    """
     logger = logging.getLogger("LRM_{}".format(name))
     logger.setLevel(level)
+    handlers = []
 
     if file:
         # add file handler
         messystemFilePath = filepath.joinpath("LRM_{}.log".format(name))
-        messystemFileLoggerHandler = logging.FileHandler(messystemFilePath.as_posix())
+        if when is not None:
+            messystemFileLoggerHandler = TimedRotatingFileHandler(messystemFilePath.as_posix(), when=when,
+                                                                  backupCount=backup_count)
+        else:
+            messystemFileLoggerHandler = RotatingFileHandler(messystemFilePath.as_posix(), maxBytes=max_bytes,
+                                                             backupCount=backup_count)
         messystemFileLoggerHandler.setFormatter(FORMATTER2)
-        # add file handler
-        logger.addHandler(messystemFileLoggerHandler)
+        handlers.append(messystemFileLoggerHandler)
 
     if systdout:
         #standardout handler
         stdoutLoggerHandler = logging.StreamHandler(sys.stdout)
         stdoutLoggerHandler.setFormatter(FORMATTER2)
-        logger.addHandler(stdoutLoggerHandler)
+        handlers.append(stdoutLoggerHandler)
+
+    if use_queue and handlers:
+        stop_logger(name)
+        q = queue.Queue(-1)
+        listener = QueueListener(q, *handlers, respect_handler_level=True)
+        listener.start()
+        _listeners[logger.name] = listener
+        logger.addHandler(DeferredQueueHandler(q))
+    else:
+        for h in handlers:
+            logger.addHandler(h)
     return logger
 
-def init_mail_logger(name=""):
+
+def stop_logger(name=""):
+    """Write the queued records of logger LRM_<name> and stop its listener thread."""
+    logger = logging.getLogger("LRM_{}".format(name))
+    for h in [h for h in logger.handlers if isinstance(h, DeferredQueueHandler)]:
+        logger.removeHandler(h)
+    listener = _listeners.pop(logger.name, None)
+    if listener is not None:
+        listener.stop()
+
+
+@atexit.register
+def _stop_listeners():
+    # registered after logging's own atexit handler, so it runs before the handlers are closed
+    while _listeners:
+        _listeners.popitem()[1].stop()
+
+def init_mail_logger(name="", **kwargs):
+    """Logger sending mails from a background thread, kwargs are passed to :class:`BatchMailHandler`."""
     logger = logging.getLogger("LRM_{}_mail".format(name))
-    mailLoggerHandler = myMailHandler(**config.mail_handler)
+    mailLoggerHandler = BatchMailHandler(**{**config.mail_handler, **kwargs})
     mailLoggerHandler.setFormatter(FORMATTER)
     mailLoggerHandler.setLevel(logging.INFO)
     logger.addHandler(mailLoggerHandler)
@@ -39,73 +107,325 @@ def init_mail_logger(name=""):
 
 
 #mail handler
-class myMailHandler(SMTPHandler):
+class BatchMailHandler(SMTPHandler):
+    """Mail handler that never blocks the logging thread.
+
+    emit() only puts the record in a queue. A background thread collects records for window seconds, coalesces
+    equal messages and sends them as one mail, at most one mail every min_interval seconds. The authenticated
+    SMTP connection is reused and closed after idle_timeout seconds without mails.
+
+    Parameters
+    ----------
+    window : float
+        seconds to wait for more records after the first record of a batch
+    min_interval : float
+        minimum seconds between two mails
+    max_queue : int
+        records exceeding the queue size are dropped and counted in the next mail
+    use_ssl : bool
+        SMTP_SSL (default) or plain SMTP, e.g. for a local SMTP stand-in
+    idle_timeout : float
+        close the SMTP connection after this many seconds without mails
+    """
+
+    def __init__(self, mailhost, fromaddr, toaddrs, subject, credentials=None, secure=None, timeout=10.0,
+                 window=30., min_interval=60., max_queue=1000, use_ssl=True, idle_timeout=120.):
+        super().__init__(mailhost, fromaddr, toaddrs, subject, credentials=credentials, secure=secure,
+                         timeout=timeout)
+        self.window = window
+        self.min_interval = min_interval
+        self.use_ssl = use_ssl
+        self.idle_timeout = idle_timeout
+        self.dropped = 0
+        self.sent = 0
+        self._queue = queue.Queue(max_queue)
+        self._smtp = None
+        self._last_send = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="BatchMailHandler", daemon=True)
+        self._thread.start()
+
     def emit(self, record):
-        """
-        Overwrite the logging.handlers.SMTPHandler.emit function with SMTP_SSL.
-        Emit a record.
-        Format the record and send it to the specified addressees.
-        """
         try:
-            port = self.mailport
-            if not port:
-                port = smtplib.SMTP_PORT
-            smtp = smtplib.SMTP_SSL(self.mailhost, port, timeout=self.timeout)
-            msg = self.format(record)
-            msg = "From: {}\r\nTo: {}\r\nSubject: {}\r\nDate: {}\r\n\r\n{}".format(self.fromaddr, ", ".join(self.toaddrs), self.getSubject(record), formatdate(), msg)
-            if self.username:
-                smtp.ehlo()
-                smtp.login(self.username, self.password)
-            smtp.sendmail(self.fromaddr, self.toaddrs, msg)
-            smtp.quit()
-        except (KeyboardInterrupt, SystemExit):
-            raise
-        except:
+            self._queue.put_nowait((record, self.format(record)))
+        except queue.Full:
+            self.dropped += 1
+        except Exception:
             self.handleError(record)
 
+    def close(self):
+        """Send the queued records and stop the background thread."""
+        self._stop.set()
+        try:
+            self._queue.put(None, timeout=1.)
+        except queue.Full:
+            pass
+        if self._thread.is_alive():
+            self._thread.join(2 * self.timeout)
+        super().close()
+
+    # background thread
+    def _run(self):
+        while True:
+            try:
+                item = self._queue.get(timeout=self.idle_timeout)
+            except queue.Empty:
+                self._disconnect()
+                continue
+            batch = [] if item is None else [item]
+            # collect till the window expired and the rate limit allows to send, or till close()
+            deadline = time.monotonic() + self.window
+            if self._last_send is not None:
+                deadline = max(deadline, self._last_send + self.min_interval)
+            while not self._stop.is_set():
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is not None:
+                    batch.append(item)
+            if self._stop.is_set():
+                while True:
+                    try:
+                        item = self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if item is not None:
+                        batch.append(item)
+            if batch:
+                self._send(batch)
+            if self._stop.is_set():
+                self._disconnect()
+                return
+
+    def _connect(self):
+        port = self.mailport or (smtplib.SMTP_SSL_PORT if self.use_ssl else smtplib.SMTP_PORT)
+        if self.use_ssl:
+            smtp = smtplib.SMTP_SSL(self.mailhost, port, timeout=self.timeout)
+        else:
+            smtp = smtplib.SMTP(self.mailhost, port, timeout=self.timeout)
+        if self.username:
+            smtp.ehlo()
+            smtp.login(self.username, self.password)
+        return smtp
+
+    def _disconnect(self):
+        if self._smtp is not None:
+            try:
+                self._smtp.quit()
+            except Exception:
+                pass
+            self._smtp = None
+
+    def _send(self, batch):
+        counts = OrderedDict()
+        for _, text in batch:
+            counts[text] = counts.get(text, 0) + 1
+        first_record = batch[0][0]
+        lines = [text if n == 1 else "{} (x{})".format(text, n) for text, n in counts.items()]
+        dropped, self.dropped = self.dropped, 0
+        if dropped:
+            lines.append("{} records dropped.".format(dropped))
+        subject = self.getSubject(first_record)
+        if len(batch) > 1:
+            subject = "{} ({} records)".format(subject, len(batch))
+        msg = "From: {}\r\nTo: {}\r\nSubject: {}\r\nDate: {}\r\n\r\n{}".format(
+            self.fromaddr, ", ".join(self.toaddrs), subject, formatdate(), "\r\n".join(lines))
+        for attempt in range(2):
+            try:
+                if self._smtp is None:
+                    self._smtp = self._connect()
+                self._smtp.sendmail(self.fromaddr, self.toaddrs, msg)
+            except Exception:
+                # e.g. connection closed by the server meanwhile, retry once with a new connection
+                self._disconnect()
+                if attempt:
+                    self.handleError(first_record)
+            else:
+                self.sent += 1
+                break
+        self._last_send = time.monotonic()
+
+
 AX_LOG_FORMAT="{timestamp}|{from_axle_sensor},\t\t{ax_number},\t\t{time_wheel_off},\t\t{time_wheel_on}\t\t{header};"
-AX_LOG_FORMAT_P=": {timestamp}|{from_axle_sensor},\t\t{ax_number:d},\t\t{time_wheel_off:f},\t\t{time_wheel_on:f}\t\t{header};"
 DATETIME_LOG_FORMAT= "%Y-%m-%d %H:%M:%S.%f"
 
-def ax_sensor_log_gen(logger, axle_sensor_names):
-    counter={n:0 for n in axle_sensor_names}
+def ax_sensor_log_gen(logger, registry, journal=None, text=True):
+    """Log axle sensor messages, axle events as AX_LOG_FORMAT rows.
+
+    The generator is sent [msg, sensor index in registry (:class:`pyLRM.axle_sensor.AxleSensorRegistry`),
+    timestamp, clear counters]. If journal (:class:`pyLRM.axle_journal.AxleJournal`) is given axle events are
+    also appended to it, with text=False they are written only to the journal (error events are still logged
+    as warning).
+    """
+    names = registry.names
+    counter = [0] * len(names)
     while 1:
-        axle_sensor_msg_frame, from_addr, timestamp, clear = yield None
-        logger.debug("{}|{}|{}|{}".format(axle_sensor_msg_frame, from_addr, timestamp, clear))
+        axle_sensor_msg, sensor, timestamp, clear = yield None
+        logger.debug("%s|%s|%s|%s", axle_sensor_msg, sensor, timestamp, clear)
         if clear:
-            for n in axle_sensor_names:
-                counter[n]=0
-        from_axle_sensor_name = config.xbee_axle_sensors_name_from_addr(from_addr)
-        logger.debug("{}".format(from_axle_sensor_name))
-        counter[from_axle_sensor_name] += 1
-        axle_sensor_msg_frame['from_axle_sensor'] = from_axle_sensor_name
-        axle_sensor_msg_frame['ax_number'] = counter[from_axle_sensor_name]
-        axle_sensor_msg_frame['timestamp'] = timestamp.strftime(DATETIME_LOG_FORMAT)
-        if axle_sensor_msg_frame['header'] == 'MSG_HEADER_AXLE':
-            logger.info(AX_LOG_FORMAT.format(**axle_sensor_msg_frame))
-        elif axle_sensor_msg_frame['header'] == 'MSG_HEADER_ERROR':
-            logger.warning(AX_LOG_FORMAT.format(**axle_sensor_msg_frame))
+            counter = [0] * len(names)
+        elif sensor >= len(counter):
+            # sensor added at runtime
+            counter.extend([0] * (len(names) - len(counter)))
+        from_axle_sensor_name = names[sensor]
+        counter[sensor] += 1
+        if isinstance(axle_sensor_msg, AxleEvent):
+            if journal is not None:
+                journal.append(timestamp, sensor, counter[sensor], axle_sensor_msg)
+                if not (text or axle_sensor_msg.is_error):
+                    continue
+            row = AX_LOG_FORMAT.format(timestamp=timestamp.strftime(DATETIME_LOG_FORMAT),
+                                       from_axle_sensor=from_axle_sensor_name,
+                                       ax_number=counter[sensor],
+                                       time_wheel_off=axle_sensor_msg.time_wheel_off,
+                                       time_wheel_on=axle_sensor_msg.time_wheel_on,
+                                       header=axle_sensor_msg.header.label)
+            if axle_sensor_msg.is_error:
+                logger.warning(row)
+            else:
+                logger.info(row)
         else:
-            logger.error(str(axle_sensor_msg_frame))
+            logger.error(str(axle_sensor_msg.to_dict()))
+
+# AX_LOG_FORMAT rows as logged (": " after the log prefix), fields: date, hour, minute, second, us, sensor,
+# ax_number, time_wheel_off, time_wheel_on, header. time_wheel_on is None for error rows.
+_AX_LOG_RE = re.compile(rb": (\d{4}-\d\d-\d\d) (\d\d):(\d\d):(\d\d)\.(\d{6})\|([^,]*),\t\t(\d+),\t\t([^,\t]+),"
+                        rb"\t\t([^\t]+)\t\t(MSG_HEADER_\w+);")
+_HEADER_CODES = {("MSG_HEADER_" + h.name).encode(): h.value for h in MsgHeader}
+
 
 def _ax_sensor_log_row_parser(row):
-    p = parse.search(AX_LOG_FORMAT_P, row)
-    if p is not None:
-        content = p.named
-        content["timestamp"] = datetime.datetime.strptime(content['timestamp'],DATETIME_LOG_FORMAT)
-        return  content
-    else:
+    """Parse one AX_LOG_FORMAT row (str) to a dict, None if row is no axle event row."""
+    m = _AX_LOG_RE.search(row.encode())
+    if m is None:
         return None
+    date, h, mi, sec, us, sensor, ax_number, toff, ton, header = (g.decode() for g in m.groups())
+    return {"timestamp": datetime.datetime.strptime("{} {}:{}:{}.{}".format(date, h, mi, sec, us),
+                                                    DATETIME_LOG_FORMAT),
+            "from_axle_sensor": sensor,
+            "ax_number": int(ax_number),
+            "time_wheel_off": float(toff),
+            "time_wheel_on": None if ton == "None" else float(ton),
+            "header": header}
+
+
+class AxleLog(object):
+    """Axle events of a log as typed columns.
+
+    Attributes
+    ----------
+    timestamp : numpy.ndarray
+        int64 nanoseconds since epoch (naive local time as logged)
+    sensor_id : numpy.ndarray
+        int16 index in sensors
+    sensors : list
+        axle sensor names
+    ax_number, time_wheel_off, time_wheel_on, header : numpy.ndarray
+        int32, float64 (seconds), float64 (seconds, NaN for error rows), uint8 (:class:`MsgHeader` value)
+    offset : int
+        byte offset after the last complete line read, pass to :meth:`AxleLogReader.read` to resume
+    """
+
+    def __init__(self, timestamp, sensor_id, sensors, ax_number, time_wheel_off, time_wheel_on, header, offset):
+        self.timestamp = timestamp
+        self.sensor_id = sensor_id
+        self.sensors = sensors
+        self.ax_number = ax_number
+        self.time_wheel_off = time_wheel_off
+        self.time_wheel_on = time_wheel_on
+        self.header = header
+        self.offset = offset
+
+    def __len__(self):
+        return len(self.timestamp)
+
+    def to_dataframe(self):
+        """pandas.DataFrame indexed by timestamp, columns as ax_sensor_log_parser rows."""
+        import pandas as pd
+        return pd.DataFrame({"from_axle_sensor": pd.Categorical.from_codes(self.sensor_id, self.sensors),
+                             "ax_number": self.ax_number,
+                             "time_wheel_off": self.time_wheel_off,
+                             "time_wheel_on": self.time_wheel_on,
+                             "header": [MsgHeader(h).label for h in self.header]},
+                            index=pd.DatetimeIndex(self.timestamp.astype('datetime64[ns]'), name="timestamp"))
+
+
+class AxleLogReader(object):
+    """Streaming parser of the axle event rows of a measurement log (AX_LOG_FORMAT).
+
+    read() can be called repeatedly on a growing log, it continues after the last complete line and sensor ids
+    stay the same across reads.
+    """
+
+    def __init__(self, filepath, offset=0):
+        self.filepath = pathlib.Path(filepath)
+        self.offset = offset
+        self.sensors = []
+        self._sensor_ids = {}
+        self._day_ns = {}  # date -> epoch ns of midnight
+
+    def _sensor_id(self, name):
+        i = self._sensor_ids.get(name)
+        if i is None:
+            i = self._sensor_ids[name] = len(self.sensors)
+            self.sensors.append(name.decode())
+        return i
+
+    def _day(self, date):
+        d = self._day_ns.get(date)
+        if d is None:
+            d = self._day_ns[date] = int(np.datetime64(date.decode(), 'ns').astype(np.int64))
+        return d
+
+    def read(self, offset=None):
+        """Parse from offset (default: where the last read stopped) to the last complete line."""
+        if offset is not None:
+            self.offset = offset
+        search = _AX_LOG_RE.search
+        ts, sid, axn, off, on, hdr = [], [], [], [], [], []
+        pos = self.offset
+        with self.filepath.open("rb") as f:
+            f.seek(pos)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break  # incomplete last line, read again next time
+                pos += len(line)
+                if b"MSG_HEADER_AXLE" not in line:
+                    continue
+                m = search(line)
+                if m is None:
+                    continue
+                date, h, mi, sec, us, sensor, ax_number, toff, ton, header = m.groups()
+                ts.append(self._day(date) + ((int(h) * 60 + int(mi)) * 60 + int(sec)) * 1000000000 + int(us) * 1000)
+                sid.append(self._sensor_id(sensor))
+                axn.append(int(ax_number))
+                off.append(float(toff))
+                on.append(float("nan") if ton == b"None" else float(ton))
+                hdr.append(_HEADER_CODES[header])
+        self.offset = pos
+        return AxleLog(np.array(ts, dtype=np.int64), np.array(sid, dtype=np.int16), list(self.sensors),
+                       np.array(axn, dtype=np.int32), np.array(off, dtype=np.float64),
+                       np.array(on, dtype=np.float64), np.array(hdr, dtype=np.uint8), pos)
+
+
+def read_ax_sensor_log(filepath, offset=0):
+    """Read the axle events of a log as :class:`AxleLog`, starting at byte offset."""
+    return AxleLogReader(filepath, offset).read()
+
 
 def ax_sensor_log_parser(filepath):
+    log = read_ax_sensor_log(filepath)
     ax = {"MSG_HEADER_AXLE": {},
           "MSG_HEADER_AXLE_ERROR": {}}
-    with filepath.open("r+") as f:
-        for row in f.readlines():
-            content =_ax_sensor_log_row_parser(row)
-            if content is not None:
-                header=content.pop("header")
-                timestamp=content.pop("timestamp")
-                ax[header][timestamp] = content
+    timestamps = log.timestamp.astype('datetime64[ns]').astype('datetime64[us]').tolist()
+    for t, sid, axn, toff, ton, h in zip(timestamps, log.sensor_id.tolist(), log.ax_number.tolist(),
+                                         log.time_wheel_off.tolist(), log.time_wheel_on.tolist(), log.header.tolist()):
+        ax[MsgHeader(h).label][t] = {"from_axle_sensor": log.sensors[sid],
+                                     "ax_number": axn,
+                                     "time_wheel_off": toff,
+                                     "time_wheel_on": None if ton != ton else ton}
     return ax
-
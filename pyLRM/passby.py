@@ -1,16 +1,18 @@
 import datetime
 import json
+from pyLRM.clock import system_clock
 
 class TrainPassby(object):
     DICT_KEYS=set(["stop_rec","start_rec","ax_data", "trigger",'sync_time'])
-    def __init__(self,axle_sensors_names, stop_delay=10, ax_counter_low_err=4):
+    def __init__(self,axle_sensors_names, stop_delay=10, ax_counter_low_err=4, clock=None, start_after_ax=2):
         self.ax_names= axle_sensors_names
+        self._clock = system_clock if clock is None else clock
         self._ax_counter={name:0 for name in self.ax_names}
         self._ax_data =[]# {name: {} for name in self.ax_names}
         #
         self.stop_delay=datetime.timedelta(seconds=stop_delay)
         self._stopped=False
-        self._start_after_ax=2
+        self._start_after_ax=start_after_ax
         #
         self._ax_counter_low_err=ax_counter_low_err
         self.errors=[]
@@ -47,14 +49,26 @@ class TrainPassby(object):
             name = name + "_ERR"
         return name
 
-    def add_axle_data(self,ax_name,header, time_wheel_on, time_wheel_off, timestamp,**kwargs):
-        self._ax_counter[ax_name]+=1
-        self._ax_data.append([timestamp, self._ax_counter[ax_name], ax_name,time_wheel_off, time_wheel_on, header])
+    def add_axle_data(self, ax_name, event, timestamp):
+        """Add an :class:`pyLRM.axle_sensor.AxleEvent` received from axle sensor ax_name."""
+        # sensors added to the registry while the passby runs
+        self._ax_counter[ax_name]=self._ax_counter.get(ax_name,0)+1
+        self._ax_data.append([timestamp, self._ax_counter[ax_name], ax_name, event.time_wheel_off, event.time_wheel_on,
+                              event.header.label])
         self._last_ax_timestamp=timestamp
 
-        if header=="MSG_HEADER_AXLE_ERROR":
+        if event.is_error:
             self.errors.append((ax_name,timestamp))
 
+    def next_deadline(self):
+        """Return the time at which rec() stops the running passby if no further axle data arrive.
+
+        None if the passby is not running. Used by the measurement loop to sleep until something happens.
+        """
+        if self._start_time is None or self._stopped or self._last_ax_timestamp is None:
+            return None
+        return self._last_ax_timestamp + self.stop_delay
+
     def add_error(self,err="timeout"):
         self.errors.append((err,self._now()))
 
@@ -67,7 +81,17 @@ class TrainPassby(object):
         self._d['sync_time']= {"xl2":xl2time,"BBG":self._now()}
 
     def _now(self):
-        return datetime.datetime.now()
+        return self._clock.now()
+
+    def to_record(self):
+        """Return the passby data as dict (used by :class:`pyLRM.passby_store.PassbyStore`)."""
+        return {"name": self._name,
+                "start_rec": self._d.get('start_rec'),
+                "stop_rec": self._d.get('stop_rec'),
+                "sync_time": self._d.get('sync_time', {}),
+                "trigger": self._ax_trigger,
+                "errors": self.errors,
+                "ax_data": self._ax_data}
 
     def export(self,path):
         filePath = path.joinpath(self._name+".json")
@@ -0,0 +1,180 @@
+import datetime
+import json
+import os
+import pathlib
+import numpy as np
+
+# axle message header codes, see pyLRM.axle_sensor.MSG_HEADER_AXLE and MSG_HEADER_AXLE_ERROR
+AXLE_HEADER_CODES = {"MSG_HEADER_AXLE": 1, "MSG_HEADER_AXLE_ERROR": 2}
+NAT = np.iinfo(np.int64).min  # missing timestamp
+
+PASSBY_COLUMNS = ["passby_id", "name", "start_rec", "stop_rec", "sync_bbg", "sync_xl2", "trigger", "n_errors"]
+AXLE_COLUMNS = ["passby_id", "timestamp", "sensor", "ax_number", "time_wheel_off", "time_wheel_on", "header"]
+
+
+def to_ns(t):
+    """datetime (or None) -> int64 nanoseconds since epoch (NAT)"""
+    if t is None:
+        return NAT
+    return int(np.datetime64(t, 'ns').astype(np.int64))
+
+
+def _float(v):
+    return np.nan if v is None else v
+
+
+class PassbyStore(object):
+    """Append-only columnar store of all passbys of a measurement session.
+
+    Layout of the store directory::
+
+        manifest.json
+        2018-11-28/part-00000.npz
+        2018-11-28/part-00001.npz
+        ...
+
+    Every partition contains two tables as typed columns: passbys (``passby_<column>``) and axle events
+    (``axle_<column>``). Timestamps are int64 nanoseconds since epoch, NAT (int64 min, numpy NaT) if missing.
+    Passbys are buffered and written as a new partition of the day of their start every ``partition_size``
+    passbys, when the day changes and on :meth:`close`. Partitions and manifest are fsynced: with the default
+    ``partition_size=1`` every passby is on disk when :meth:`append` returns, as the json export.
+
+    Parameters
+    ----------
+    path : pathlib.Path
+        store directory, created if missing.
+    partition_size : int
+        number of passbys per partition. Up to partition_size - 1 buffered passbys are lost on power loss.
+    """
+    MANIFEST = "manifest.json"
+
+    def __init__(self, path, partition_size=1):
+        self.path = pathlib.Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.partition_size = partition_size
+        self._manifest = self._read_manifest(self.path)
+        self._buffer = []
+        self._buffer_day = None
+
+    @classmethod
+    def _read_manifest(cls, path):
+        manifest_path = path.joinpath(cls.MANIFEST)
+        if manifest_path.exists():
+            with manifest_path.open("r") as f:
+                return json.load(f)
+        return {"version": 1, "n_passby": 0, "partitions": []}
+
+    def _write_manifest(self):
+        tmp = self.path.joinpath(self.MANIFEST + ".tmp")
+        with tmp.open("w") as f:
+            json.dump(self._manifest, f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp.as_posix(), self.path.joinpath(self.MANIFEST).as_posix())
+        # persist the rename
+        fd = os.open(self.path.as_posix(), os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def append(self, passby):
+        """Add a :class:`pyLRM.passby.TrainPassby`."""
+        record = passby.to_record()
+        t = record['start_rec']
+        if t is None:
+            t = record['ax_data'][0][0] if record['ax_data'] else datetime.datetime.now()
+        day = "{:%Y-%m-%d}".format(t)
+        if self._buffer and day != self._buffer_day:
+            self.flush()
+        self._buffer_day = day
+        record['passby_id'] = self._manifest['n_passby']
+        self._manifest['n_passby'] += 1
+        self._buffer.append(record)
+        if len(self._buffer) >= self.partition_size:
+            self.flush()
+
+    def flush(self):
+        """Write buffered passbys as a new partition."""
+        if not self._buffer:
+            return
+        records = self._buffer
+        axles = [(r['passby_id'], row) for r in records for row in r['ax_data']]
+        columns = {
+            "passby_passby_id": np.array([r['passby_id'] for r in records], dtype=np.int64),
+            "passby_name": np.array([r['name'] for r in records], dtype=str),
+            "passby_start_rec": np.array([to_ns(r['start_rec']) for r in records], dtype=np.int64),
+            "passby_stop_rec": np.array([to_ns(r['stop_rec']) for r in records], dtype=np.int64),
+            "passby_sync_bbg": np.array([to_ns(r['sync_time'].get('BBG')) for r in records], dtype=np.int64),
+            "passby_sync_xl2": np.array([to_ns(r['sync_time'].get('xl2')) for r in records], dtype=np.int64),
+            "passby_trigger": np.array([r['trigger'] or "" for r in records], dtype=str),
+            "passby_n_errors": np.array([len(r['errors']) for r in records], dtype=np.int32),
+            # ax_data row: timestamp, ax_number, ax_name, time_wheel_off, time_wheel_on, header
+            "axle_passby_id": np.array([i for i, _ in axles], dtype=np.int64),
+            "axle_timestamp": np.array([to_ns(row[0]) for _, row in axles], dtype=np.int64),
+            "axle_sensor": np.array([row[2] for _, row in axles], dtype=str),
+            "axle_ax_number": np.array([row[1] for _, row in axles], dtype=np.int32),
+            "axle_time_wheel_off": np.array([_float(row[3]) for _, row in axles], dtype=np.float64),
+            "axle_time_wheel_on": np.array([_float(row[4]) for _, row in axles], dtype=np.float64),
+            "axle_header": np.array([AXLE_HEADER_CODES.get(row[5], 0) for _, row in axles], dtype=np.uint8),
+        }
+        day_dir = self.path.joinpath(self._buffer_day)
+        day_dir.mkdir(exist_ok=True)
+        n = sum(1 for p in self._manifest['partitions'] if p['day'] == self._buffer_day)
+        part = day_dir.joinpath("part-{:05d}.npz".format(n))
+        with part.open("wb") as f:
+            np.savez(f, **columns)
+            f.flush()
+            os.fsync(f.fileno())
+        self._manifest['partitions'].append({"file": part.relative_to(self.path).as_posix(),
+                                             "day": self._buffer_day,
+                                             "n_passby": len(records),
+                                             "n_axles": len(axles)})
+        self._write_manifest()
+        self._buffer = []
+
+    def close(self):
+        self.flush()
+
+    @classmethod
+    def load(cls, path, days=None):
+        """Read the store.
+
+        Parameters
+        ----------
+        path : pathlib.Path
+            store directory
+        days : iterable
+            read only partitions of these days ('YYYY-MM-DD'), all if None
+
+        Returns
+        -------
+        passbys, axles : dict
+            column name -> numpy array for the passbys and the axle events tables
+        """
+        path = pathlib.Path(path)
+        manifest = cls._read_manifest(path)
+        days = None if days is None else set(days)
+        parts = [p for p in manifest['partitions'] if days is None or p['day'] in days]
+        data = {c: [] for c in ["passby_" + c for c in PASSBY_COLUMNS] + ["axle_" + c for c in AXLE_COLUMNS]}
+        for p in parts:
+            with np.load(path.joinpath(p['file']).as_posix(), allow_pickle=False) as npz:
+                for c in data:
+                    data[c].append(npz[c])
+        cols = {c: (np.concatenate(v) if v else np.array([])) for c, v in data.items()}
+        passbys = {c: cols["passby_" + c] for c in PASSBY_COLUMNS}
+        axles = {c: cols["axle_" + c] for c in AXLE_COLUMNS}
+        return passbys, axles
+
+    @classmethod
+    def to_dataframes(cls, path, days=None):
+        """Read the store as two pandas.DataFrame (passbys, axles) with datetime64 columns."""
+        import pandas as pd
+        passbys, axles = cls.load(path, days)
+        passbys = pd.DataFrame(passbys)
+        axles = pd.DataFrame(axles)
+        for df, cols in ((passbys, ["start_rec", "stop_rec", "sync_bbg", "sync_xl2"]), (axles, ["timestamp"])):
+            for c in cols:
+                # NAT is the int64 value of NaT, no float round trip
+                df[c] = df[c].values.astype(np.int64).astype('datetime64[ns]')
+        return passbys, axles
@@ -0,0 +1,153 @@
+import itertools
+import math
+import numpy as np
+from pyLRM.axle_sensor import AxleEvent, MsgHeader, AXLE_SENSOR_COUNTER_SAMPLE_RATE
+from pyLRM.clock import SimulatedClock
+
+# Offline replay of the passby trigger logic.
+#
+# Recorded axle events are fed into a TrainPassby (e.g. config.MyTrainPassby) in time order. The passby reads the
+# time from a SimulatedClock that jumps from event to event and to the stop deadlines, so a month of data is
+# replayed without waiting out the real time. The decisions follow AcquisitionEngine._passby_task.
+
+
+def _counter(seconds):
+    if seconds is None or math.isnan(seconds):
+        return None
+    return int(round(seconds * AXLE_SENSOR_COUNTER_SAMPLE_RATE))
+
+
+def _event(header, time_wheel_off, time_wheel_on):
+    if header == MsgHeader.AXLE_ERROR:
+        return AxleEvent(MsgHeader.AXLE_ERROR, None, _counter(time_wheel_off))
+    return AxleEvent(MsgHeader.AXLE, _counter(time_wheel_on), _counter(time_wheel_off))
+
+
+def _events(timestamps, sensors, headers, time_wheel_off, time_wheel_on):
+    """events from columns, stable sorted by timestamp (events of one xbee payload share a timestamp)"""
+    order = np.argsort(timestamps, kind='stable')
+    timestamps = timestamps[order].astype('datetime64[ns]').astype('datetime64[us]').tolist()
+    return [(t, s, _event(h, off, on)) for t, s, h, off, on in zip(timestamps,
+                                                                  sensors[order].tolist(),
+                                                                  headers[order].tolist(),
+                                                                  time_wheel_off[order].tolist(),
+                                                                  time_wheel_on[order].tolist())]
+
+
+def events_from_log(filepath):
+    """Axle events of a measurement log (see :func:`pyLRM.logging_handler.read_ax_sensor_log`).
+
+    Returns
+    -------
+    list
+        (timestamp, axle sensor name, :class:`pyLRM.axle_sensor.AxleEvent`) sorted by timestamp
+    """
+    from pyLRM.logging_handler import read_ax_sensor_log
+    log = read_ax_sensor_log(filepath)
+    sensors = np.array(log.sensors, dtype=object)[log.sensor_id]
+    return _events(log.timestamp, sensors, log.header, log.time_wheel_off, log.time_wheel_on)
+
+
+def events_from_store(path, days=None):
+    """Axle events of a :class:`pyLRM.passby_store.PassbyStore`, same format as :func:`events_from_log`."""
+    from pyLRM.passby_store import PassbyStore
+    _, axles = PassbyStore.load(path, days)
+    return _events(axles['timestamp'].astype(np.int64), axles['sensor'], axles['header'], axles['time_wheel_off'],
+                   axles['time_wheel_on'])
+
+
+def replay(events, passby_factory):
+    """Run the trigger logic over recorded axle events.
+
+    Parameters
+    ----------
+    events : iterable
+        (timestamp, axle sensor name, AxleEvent) in time order, see :func:`events_from_log`
+    passby_factory : callable
+        passby_factory(clock) return a new :class:`pyLRM.passby.TrainPassby` reading the time from clock, e.g.
+        ``lambda clock: config.MyTrainPassby(names, clock=clock)``
+
+    Returns
+    -------
+    list
+        the passbys that would have been exported: recorded passbys (start_rec and stop_rec set) and error
+        passbys without recording
+    """
+    clock = SimulatedClock()
+    passbys = []
+
+    passby = passby_factory(clock)
+    rec = False
+
+    def step():
+        nonlocal passby, rec
+        if passby.rec():
+            if not rec:
+                rec = True
+                passby.set_rec_start_time()
+        elif rec:
+            rec = False
+            passby.set_rec_stop_time()
+            passbys.append(passby)
+            passby = passby_factory(clock)
+        elif passby.is_error:
+            passbys.append(passby)
+            passby = passby_factory(clock)
+
+    for timestamp, ax_name, event in events:
+        # stop deadlines reached before this event
+        deadline = passby.next_deadline()
+        while deadline is not None and deadline <= timestamp:
+            clock.set(deadline)
+            step()
+            deadline = passby.next_deadline()
+        clock.set(timestamp)
+        passby.add_axle_data(ax_name, event, timestamp)
+        step()
+
+    deadline = passby.next_deadline()
+    if deadline is not None:
+        clock.set(deadline)
+        step()
+    return passbys
+
+
+def summary(passbys):
+    """Passbys of :func:`replay` as list of dict (one row per passby)."""
+    rows = []
+    for p in passbys:
+        rows.append({"name": p._name,
+                     "start_rec": p._d.get('start_rec'),
+                     "stop_rec": p._d.get('stop_rec'),
+                     "trigger": p._ax_trigger,
+                     "errors": [e for e, _ in p.errors],
+                     "ax_counts": dict(p._ax_counter)})
+    return rows
+
+
+def sweep(events, passby_cls, axle_sensors_names, stop_delay=(10,), ax_counter_low_err=(4,), start_after_ax=(2,)):
+    """Replay events for every combination of the trigger parameters.
+
+    Parameters
+    ----------
+    events : list
+        see :func:`events_from_log`, read only once for all combinations
+    passby_cls : type
+        TrainPassby subclass, e.g. config.MyTrainPassby
+    axle_sensors_names : list
+        axle sensor names, order as in the measurement
+    stop_delay, ax_counter_low_err, start_after_ax : iterable
+        values of the parameters
+
+    Returns
+    -------
+    dict
+        (stop_delay, ax_counter_low_err, start_after_ax) -> list of passbys
+    """
+    results = {}
+    for sd, low, start in itertools.product(stop_delay, ax_counter_low_err, start_after_ax):
+        def factory(clock):
+            return passby_cls(axle_sensors_names=list(axle_sensors_names), stop_delay=sd, ax_counter_low_err=low,
+                              clock=clock, start_after_ax=start)
+        results[(sd, low, start)] = replay(events, factory)
+    return results
@@ -0,0 +1,169 @@
+import numpy as np
+
+# Vectorized segmentation of axle event tables into passbys.
+#
+# Same rule as the live trigger in MyTrainPassby.rec: a passby ends when no axle event arrives for stop_delay
+# seconds, i.e. a new passby starts at every event whose gap to the previous one is >= stop_delay.
+
+
+def _to_ns(timestamps):
+    """timestamps (int64 ns, datetime64 or datetime objects) -> int64 ns array"""
+    t = np.asarray(timestamps)
+    if t.dtype == np.int64:
+        return t
+    return t.astype('datetime64[ns]').astype(np.int64)
+
+
+def passby_ids(timestamps, stop_delay=10, gaps=None):
+    """Return the passby id of every axle event.
+
+    Parameters
+    ----------
+    timestamps : array_like
+        event timestamps, int64 ns since epoch, datetime64 or datetime. Need not be sorted.
+    stop_delay : float
+        seconds without axle events that end a passby
+    gaps : array_like
+        optional gap in seconds to the previous event of every row, e.g. the axle sensor ``time_wheel_off``
+        (as ``calc_pby`` in visualize_axle_sensor_logs.ipynb). A new passby starts where ``gaps > stop_delay``.
+        If None the gaps are computed from the timestamps.
+
+    Returns
+    -------
+    ids : numpy.ndarray
+        int64 passby id, 0 based and increasing with time, in the order of timestamps
+    order : numpy.ndarray
+        indices sorting the events by time
+    """
+    t = _to_ns(timestamps)
+    order = np.argsort(t, kind='stable')
+    n = len(t)
+    new = np.empty(n, dtype=bool)
+    if n:
+        new[0] = True
+        if gaps is None:
+            new[1:] = np.diff(t[order]) >= int(stop_delay * 1e9)
+        else:
+            new[1:] = np.asarray(gaps, dtype=np.float64)[order][1:] > stop_delay
+    ids = np.empty(n, dtype=np.int64)
+    ids[order] = np.cumsum(new) - 1
+    return ids, order
+
+
+def _group_cumcount(keys):
+    """0 based running count of every row within its key group (order of rows is kept)"""
+    order = np.argsort(keys, kind='stable')
+    k = keys[order]
+    first = np.empty(len(k), dtype=bool)
+    if len(k):
+        first[0] = True
+        first[1:] = k[1:] != k[:-1]
+    starts = np.flatnonzero(first)
+    pos = np.arange(len(k)) - np.repeat(starts, np.diff(np.append(starts, len(k))))
+    count = np.empty(len(k), dtype=np.int64)
+    count[order] = pos
+    return count
+
+
+def segment_passbys(timestamps, sensors, is_error=None, stop_delay=10, ax_counter_low_err=4, gaps=None):
+    """Split a whole axle event table into passbys.
+
+    Parameters
+    ----------
+    timestamps : array_like
+        event timestamps, see :func:`passby_ids`
+    sensors : array_like
+        axle sensor name of every event
+    is_error : array_like
+        bool, True for MSG_HEADER_AXLE_ERROR events. None if no errors.
+    stop_delay : float
+        seconds without axle events that end a passby
+    ax_counter_low_err : int
+        a passby with less axles than this on any sensor is flagged as error (as in MyTrainPassby.rec)
+    gaps : array_like
+        see :func:`passby_ids`
+
+    Returns
+    -------
+    events : dict
+        per event columns in the input order: ``passby_id`` and ``ax`` (1 based axle number of the sensor in the
+        passby, as ``ax_number`` in the passby files)
+    passbys : dict
+        per passby columns: ``passby_id``, ``start``, ``stop`` (int64 ns), ``n_axles``, ``sensors``
+        (sensor names, order of the columns of the following 2d arrays), ``counts`` and ``errors``
+        (n_passby x n_sensors axle and error counts), ``is_error``
+    """
+    t = _to_ns(timestamps)
+    ids, order = passby_ids(t, stop_delay, gaps)
+    names, scode = np.unique(np.asarray(sensors), return_inverse=True)
+    ns = len(names)
+    npby = int(ids.max()) + 1 if len(ids) else 0
+    key = ids * ns + scode
+    # cumcount in time order
+    ax = np.empty(len(t), dtype=np.int64)
+    ax[order] = _group_cumcount(key[order]) + 1
+
+    counts = np.bincount(key, minlength=npby * ns).reshape(npby, ns)
+    if is_error is None:
+        errors = np.zeros((npby, ns), dtype=np.int64)
+    else:
+        errors = np.bincount(key, weights=np.asarray(is_error, dtype=bool), minlength=npby * ns)
+        errors = errors.astype(np.int64).reshape(npby, ns)
+
+    ts = t[order]
+    sid = ids[order]
+    bounds = np.flatnonzero(np.diff(sid)) + 1
+    first = np.concatenate(([0], bounds)) if len(ts) else np.array([], dtype=np.int64)
+    last = np.concatenate((bounds - 1, [len(ts) - 1])) if len(ts) else np.array([], dtype=np.int64)
+
+    events = {"passby_id": ids, "ax": ax}
+    passbys = {"passby_id": np.arange(npby, dtype=np.int64),
+               "start": ts[first],
+               "stop": ts[last],
+               "n_axles": counts.sum(axis=1),
+               "sensors": names,
+               "counts": counts,
+               "errors": errors,
+               "is_error": (errors.sum(axis=1) > 0) | (counts < ax_counter_low_err).any(axis=1)}
+    return events, passbys
+
+
+def segment_axle_dataframe(df, stop_delay=10, ax_counter_low_err=4, timestamp="timestamp",
+                           sensor="from_axle_sensor", header="header", gap=None):
+    """:func:`segment_passbys` for a pandas.DataFrame of axle events.
+
+    Works with the DataFrame of the axle log (``ax_sensor_log_parser``, timestamp as index) and with the axle
+    table of :class:`pyLRM.passby_store.PassbyStore` (``timestamp="timestamp", sensor="sensor"``).
+
+    Parameters
+    ----------
+    timestamp, sensor, header : str
+        column names. If timestamp is not a column the index is used. If header is missing no event is an error.
+    gap : str
+        optional column with the gap to the previous event in seconds (e.g. ``"time_wheel_off"``)
+
+    Returns
+    -------
+    events : pandas.DataFrame
+        df with the additional columns ``passby`` and ``ax``
+    passbys : pandas.DataFrame
+        one row per passby: start, stop, n_axles, is_error and ``count_<sensor>``, ``errors_<sensor>`` columns
+    """
+    import pandas as pd
+    ts = df[timestamp].values if timestamp in df.columns else df.index.values
+    is_error = None
+    if header in df.columns:
+        h = df[header].values
+        is_error = (h == "MSG_HEADER_AXLE_ERROR") | (h == 2)
+    gaps = None if gap is None else df[gap].values
+    events, pby = segment_passbys(ts, df[sensor].values, is_error, stop_delay, ax_counter_low_err, gaps)
+    out = df.assign(passby=events["passby_id"], ax=events["ax"])
+    summary = pd.DataFrame({"start": pd.to_datetime(pby["start"], unit='ns'),
+                            "stop": pd.to_datetime(pby["stop"], unit='ns'),
+                            "n_axles": pby["n_axles"],
+                            "is_error": pby["is_error"]},
+                           index=pd.Index(pby["passby_id"], name="passby"))
+    for i, name in enumerate(pby["sensors"]):
+        summary["count_{}".format(name)] = pby["counts"][:, i]
+        summary["errors_{}".format(name)] = pby["errors"][:, i]
+    return out, summary
@@ -2,10 +2,9 @@ import pathlib
 from serial.tools import list_ports
 from digi.xbee.devices import XBeeDevice
 import time
-from pyLRM.axle_sensor import parse_msg, unstuff_frame_from_serial_data, init_axle_sensors_network,setup_axle_sensors
-from datetime import datetime
+from pyLRM.axle_sensor import AxleEvent, parse_msg, unstuff_frame_from_serial_data, init_axle_sensors_network,setup_axle_sensors
+from pyLRM.clock import system_clock
 import pyLRM.config as config
-from pyLRM.config import xbee_axle_sensors_name_from_addr
 from pyLRM.passby import TrainPassby
 from pyLRM.logging_handler import init_logger, ax_sensor_log_gen
 import argparse
@@ -31,11 +30,15 @@ def serial_port_by_vid_pid(vid,pid,logger):
 def data_receive_callback(xbee_message):
     """unstuff frames parse msg and log message"""
     from_address = xbee_message.remote_device.get_64bit_addr()
+    sensor = config.axle_sensors_registry.index(from_address)
+    if sensor is None:
+        logger.error("Msg from unknown xbee {}. Skipped.".format(from_address))
+        return
     frames = g_unstuff_frame.send(xbee_message.data)
     for frame in frames:
         try:
             msg = parse_msg(frame)
-            g_msg_Q.put([msg, from_address, datetime.now()])
+            g_msg_Q.put([msg, sensor, system_clock.now()])
             #
         except Exception as e:
             logger.critical(e)
@@ -124,7 +127,7 @@ if __name__=="__main__":
         g_unstuff_frame = unstuff_frame_from_serial_data()  # generator used only in xbee thread(not thread safe!)
         g_unstuff_frame.send(None)
         # init log generator
-        ax_log_gen = ax_sensor_log_gen(logger, config.xbee_axle_sensors_names)
+        ax_log_gen = ax_sensor_log_gen(logger, config.axle_sensors_registry)
         ax_log_gen.send(None)
 
         if args.passby:
@@ -141,14 +144,15 @@ if __name__=="__main__":
         while True:
             time.sleep(0.001)
             if not g_msg_Q.empty():
-                msg, from_address, timestamp = g_msg_Q.get()
-                ax_name = xbee_axle_sensors_name_from_addr(from_address)
-                ax_log_gen.send([msg, from_address, timestamp, clear])
+                msg, sensor, timestamp = g_msg_Q.get()
+                ax_name = config.axle_sensors_registry.names[sensor]
+                ax_log_gen.send([msg, sensor, timestamp, clear])
 
                 if args.passby:
                     if clear:
                         clear = False
-                    passby.add_axle_data(**{**msg, 'ax_name': ax_name, 'timestamp': timestamp})
+                    if isinstance(msg, AxleEvent):
+                        passby.add_axle_data(ax_name, msg, timestamp)
             ##start stop rec
             if args.passby:
                 if passby.rec():
@@ -1,4 +1,15 @@
-from pyLRM.logging_handler import init_logger
+from pyLRM.logging_handler import init_mail_logger
+import argparse
 if __name__=="__main__":
-    logger = init_logger('test_mail_logger',file=False,mail=True)
-    logger.critical("This is a Test msg generated from test_mail_logger.py.")
\ No newline at end of file
+    parser = argparse.ArgumentParser(prog='PROG', description='Sendet einen testmail.')
+    parser.add_argument('-local', type=int, default=None,
+                        help='Send without SSL to a local SMTP server on this port, '
+                             'e.g. python3 -m aiosmtpd -n -l localhost:1025')
+    args = parser.parse_args()
+    kwargs = {"window": 1., "min_interval": 0.}
+    if args.local is not None:
+        kwargs.update(mailhost=("localhost", args.local), credentials=None, use_ssl=False)
+    logger = init_mail_logger('test_mail_logger', **kwargs)
+    logger.critical("This is a Test msg generated from test_mail_logger.py.")
+    for handler in logger.handlers:
+        handler.close()
@@ -0,0 +1,72 @@
+import itertools
+import math
+import sys
+import pathlib
+import parse
+
+sys.path.insert(0, str(pathlib.Path(__file__).parent.joinpath("NTiXL2")))
+from ntixl2 import message
+from ntixl2.message import _RegexTemplate, _FIELD
+
+# field values tried for every field type of the RETURN templates
+SAMPLES = {None: ['LIVE', ' LIVE', 'a,b', 'x y', ''],
+           'd': ['18', ' 18', '  18', '-5', ' -5', '- 5', '+-5', '007', '0x1A', '0b101', '0o17', '+', 'a', '', '1.5'],
+           'g': ['45.2', ' 45.2', '  45.2', '+45.', '-45.2', '45', '.5', '1e3', '1.5E-2', 'nan', 'NaN', ' nan',
+                 '-nan', 'inf', '-inf', '+INF', ' inf', 'x', ''],
+           'f': ['.5', ' .5', '45.2', '45', '+45.', '-0.5', 'nan', '-nan', 'inf', '']}
+
+
+def return_messages():
+    """Message classes with answers"""
+    for name in dir(message):
+        cls = getattr(message, name)
+        if isinstance(cls, type) and issubclass(cls, message.Message) and cls.RETURN is not None:
+            yield cls
+
+
+def _same(a, b):
+    if a is None or b is None:
+        return a is b
+    if a.keys() != b.keys():
+        return False
+    for k in a:
+        x, y = a[k], b[k]
+        if isinstance(x, float) and isinstance(y, float) and math.isnan(x) and math.isnan(y):
+            continue
+        if type(x) is not type(y) or x != y:
+            return False
+    return True
+
+
+def lines(template):
+    """answers lines from the SAMPLES of the template fields"""
+    fields = list(_FIELD.finditer(template))
+    for values in itertools.product(*[SAMPLES[m.group(2)] for m in fields]):
+        s, pos = "", 0
+        for m, v in zip(fields, values):
+            s += template[pos:m.start()] + v
+            pos = m.end()
+        s += template[pos:]
+        yield s
+        yield s.rstrip("\r\n") + "\n"
+
+
+def test_regex_template_equals_parse():
+    n = 0
+    for cls in return_messages():
+        template = cls.RETURN + cls.EOL
+        if not _RegexTemplate.is_simple(template):
+            continue
+        fast, ref = _RegexTemplate(template), parse.compile(template)
+        for line in lines(template):
+            a, b = fast.parse(line), ref.parse(line)
+            a = None if a is None else a.named
+            b = None if b is None else b.named
+            assert _same(a, b), "{}: {!r} -> {} (parse: {})".format(cls.__name__, line, a, b)
+            n += 1
+    assert n > 0
+    return n
+
+
+if __name__ == "__main__":
+    print("{} answers lines parsed equal to parse.".format(test_regex_template_equals_parse()))